@@ -0,0 +1,298 @@
+from asyncio import AbstractEventLoop, Event as AsyncEvent, IncompleteReadError, StreamReader, StreamWriter, Task, new_event_loop, start_unix_server
+from dataclasses import dataclass
+from os import path, unlink
+from socket import AF_UNIX, SOCK_STREAM, socket
+from struct import Struct
+from threading import Event, Lock, Thread
+from time import monotonic
+from collections.abc import Iterator
+from .ledmatrix import LED_MATRIX_COLS, LED_MATRIX_ROWS
+
+# Wire format: every message is a HEADER (type, payload length) followed by the payload.
+# Strings (matrix IDs) are encoded as a single length byte followed by UTF-8.
+#
+# Client -> daemon:
+#   MSG_OVERLAY:   matrix id, OVERLAY_INFO, rows * cols pixels -> MSG_OK (overlay id)
+#   MSG_REMOVE:    OVERLAY_ID                                  -> MSG_OK (1 if removed, else 0)
+#   MSG_SUBSCRIBE: matrix id (empty for all matrices)          -> MSG_OK (0), then MSG_FRAME for every committed frame
+# Daemon -> client:
+#   MSG_OK:        OVERLAY_ID
+#   MSG_ERROR:     UTF-8 error message
+#   MSG_FRAME:     matrix id, LED_MATRIX_ROWS * LED_MATRIX_COLS pixels
+
+HEADER = Struct("<BH")
+OVERLAY_INFO = Struct("<BIBBBB") # priority, ttl (ms, 0 = until removed), row, col, rows, cols
+OVERLAY_ID = Struct("<I")
+
+MSG_OVERLAY = 0x01
+MSG_REMOVE = 0x02
+MSG_SUBSCRIBE = 0x03
+MSG_OK = 0x80
+MSG_FRAME = 0x81
+MSG_ERROR = 0xFF
+
+class ControlProtocolError(ValueError):
+    pass
+
+def pack_message(msg_type: int, payload: bytes) -> bytes:
+    return HEADER.pack(msg_type, len(payload)) + payload
+
+def pack_str(value: str) -> bytes:
+    raw = value.encode("utf-8")
+    if len(raw) > 0xFF:
+        raise ControlProtocolError("String too long")
+    return bytes([len(raw)]) + raw
+
+def unpack_str(payload: bytes, offset: int = 0) -> tuple[str, int]:
+    if offset >= len(payload):
+        raise ControlProtocolError("Truncated string")
+    end = offset + 1 + payload[offset]
+    if end > len(payload):
+        raise ControlProtocolError("Truncated string")
+    try:
+        return payload[offset + 1:end].decode("utf-8"), end
+    except UnicodeDecodeError as e:
+        raise ControlProtocolError(f"Invalid string: {e}") from e
+
+@dataclass(kw_only=True, frozen=True)
+class Overlay:
+    id: int
+    matrix_id: str
+    priority: int
+    expires: float | None
+    # (src start, src end, dst start, dst end) spans into data
+    blits: tuple[tuple[int, int, int, int], ...]
+    data: bytes
+
+class OverlayStore:
+    # Set whenever overlays change so the render loop can present them right away
+    wakeup: Event
+    _lock: Lock
+    _overlays: dict[int, Overlay]
+    _next_id: int
+
+    def __init__(self):
+        super().__init__()
+        self.wakeup = Event()
+        self._lock = Lock()
+        self._overlays = {}
+        self._next_id = 1
+
+    def add(self, matrix_id: str, priority: int, ttl: float | None, row: int, col: int, rows: int, cols: int, data: bytes) -> int:
+        if rows <= 0 or cols <= 0 or row + rows > LED_MATRIX_ROWS or col + cols > LED_MATRIX_COLS:
+            raise ControlProtocolError("Overlay out of range")
+        if len(data) != rows * cols:
+            raise ControlProtocolError(f"Invalid overlay size expected={rows * cols} actual={len(data)}")
+
+        blits: list[tuple[int, int, int, int]] = []
+        for y in range(rows):
+            dst_start = ((row + y) * LED_MATRIX_COLS) + col
+            blits.append((y * cols, (y + 1) * cols, dst_start, dst_start + cols))
+
+        with self._lock:
+            overlay_id = self._next_id
+            self._next_id += 1
+            self._overlays[overlay_id] = Overlay(
+                id=overlay_id,
+                matrix_id=matrix_id,
+                priority=priority,
+                expires=(monotonic() + ttl) if ttl else None,
+                blits=tuple(blits),
+                data=data,
+            )
+        self.wakeup.set()
+        return overlay_id
+
+    def remove(self, overlay_id: int) -> bool:
+        with self._lock:
+            removed = self._overlays.pop(overlay_id, None) is not None
+        if removed:
+            self.wakeup.set()
+        return removed
+
+    def _active(self, matrix_id: str) -> list[Overlay]:
+        now = monotonic()
+        with self._lock:
+            expired = [o.id for o in self._overlays.values() if o.expires is not None and o.expires <= now]
+            for overlay_id in expired:
+                del self._overlays[overlay_id]
+            overlays = [o for o in self._overlays.values() if o.matrix_id == matrix_id]
+        overlays.sort(key=lambda o: (o.priority, o.id))
+        return overlays
+
+    def has_overlays(self, matrix_id: str) -> bool:
+        return bool(self._active(matrix_id))
+
+    def apply(self, matrix_id: str, frame: bytearray) -> None:
+        # Lowest priority first, so higher priority overlays end up on top
+        for overlay in self._active(matrix_id):
+            for src_start, src_end, dst_start, dst_end in overlay.blits:
+                frame[dst_start:dst_end] = overlay.data[src_start:src_end]
+
+class _Subscriber:
+    matrix_id: str
+    # Only the newest frame of every matrix is kept, slow clients skip frames instead of buffering them
+    frames: dict[str, bytes]
+    ready: AsyncEvent
+
+    def __init__(self, matrix_id: str):
+        super().__init__()
+        self.matrix_id = matrix_id
+        self.frames = {}
+        self.ready = AsyncEvent()
+
+    def push(self, matrix_id: str, message: bytes) -> None:
+        if self.matrix_id and self.matrix_id != matrix_id:
+            return
+        self.frames[matrix_id] = message
+        self.ready.set()
+
+    def take(self) -> list[bytes]:
+        messages = list(self.frames.values())
+        self.frames.clear()
+        self.ready.clear()
+        return messages
+
+class ControlServer:
+    overlays: OverlayStore
+    socket_path: str
+    _loop: AbstractEventLoop
+    _thread: Thread
+    _subscribers: set[_Subscriber]
+
+    def __init__(self, socket_path: str, overlays: OverlayStore):
+        super().__init__()
+        self.socket_path = socket_path
+        self.overlays = overlays
+        self._loop = new_event_loop()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._subscribers = set()
+
+    def start(self) -> None:
+        if path.exists(self.socket_path):
+            unlink(self.socket_path)
+        _ = self._loop.run_until_complete(start_unix_server(self._handle_client, path=self.socket_path))
+        self._thread.start()
+
+    def _run(self) -> None:
+        self._loop.run_forever()
+
+    def publish_frame(self, matrix_id: str, frame: bytes) -> None:
+        if not self._subscribers:
+            return
+        message = pack_message(MSG_FRAME, pack_str(matrix_id) + frame)
+        _ = self._loop.call_soon_threadsafe(self._publish, matrix_id, message)
+
+    def _publish(self, matrix_id: str, message: bytes) -> None:
+        for subscriber in self._subscribers:
+            subscriber.push(matrix_id, message)
+
+    async def _send_frames(self, subscriber: _Subscriber, writer: StreamWriter) -> None:
+        while True:
+            _ = await subscriber.ready.wait()
+            for message in subscriber.take():
+                writer.write(message)
+            await writer.drain()
+
+    def _handle_message(self, msg_type: int, payload: bytes) -> int:
+        if msg_type == MSG_OVERLAY:
+            matrix_id, offset = unpack_str(payload)
+            if len(payload) < offset + OVERLAY_INFO.size:
+                raise ControlProtocolError("Truncated overlay")
+            priority, ttl_ms, row, col, rows, cols = OVERLAY_INFO.unpack_from(payload, offset)
+            return self.overlays.add(
+                matrix_id=matrix_id,
+                priority=priority,
+                ttl=ttl_ms / 1000,
+                row=row,
+                col=col,
+                rows=rows,
+                cols=cols,
+                data=payload[offset + OVERLAY_INFO.size:],
+            )
+
+        if msg_type == MSG_REMOVE:
+            if len(payload) != OVERLAY_ID.size:
+                raise ControlProtocolError("Invalid remove message")
+            overlay_id, = OVERLAY_ID.unpack(payload)
+            return 1 if self.overlays.remove(overlay_id) else 0
+
+        raise ControlProtocolError(f"Unknown message type {msg_type}")
+
+    async def _handle_client(self, reader: StreamReader, writer: StreamWriter) -> None:
+        subscriber: _Subscriber | None = None
+        sender: Task[None] | None = None
+        try:
+            while True:
+                msg_type, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+                payload = await reader.readexactly(length)
+
+                try:
+                    if msg_type == MSG_SUBSCRIBE and not subscriber:
+                        matrix_id, _ = unpack_str(payload)
+                        subscriber = _Subscriber(matrix_id)
+                        self._subscribers.add(subscriber)
+                        sender = self._loop.create_task(self._send_frames(subscriber, writer))
+                        result = 0
+                    else:
+                        result = self._handle_message(msg_type, payload)
+                    writer.write(pack_message(MSG_OK, OVERLAY_ID.pack(result)))
+                except ControlProtocolError as e:
+                    writer.write(pack_message(MSG_ERROR, str(e).encode("utf-8")))
+                await writer.drain()
+        except (IncompleteReadError, ConnectionError, ControlProtocolError):
+            pass
+        finally:
+            if subscriber:
+                self._subscribers.discard(subscriber)
+            if sender:
+                _ = sender.cancel()
+            writer.close()
+
+class ControlClient:
+    _sock: socket
+
+    def __init__(self, socket_path: str):
+        super().__init__()
+        self._sock = socket(AF_UNIX, SOCK_STREAM)
+        self._sock.connect(socket_path)
+
+    def close(self) -> None:
+        self._sock.close()
+
+    def _recv_exactly(self, length: int) -> bytes:
+        data = b""
+        while len(data) < length:
+            chunk = self._sock.recv(length - len(data))
+            if not chunk:
+                raise ConnectionError("Control socket closed")
+            data += chunk
+        return data
+
+    def _recv_message(self) -> tuple[int, bytes]:
+        msg_type, length = HEADER.unpack(self._recv_exactly(HEADER.size))
+        return msg_type, self._recv_exactly(length)
+
+    def _request(self, msg_type: int, payload: bytes) -> int:
+        self._sock.sendall(pack_message(msg_type, payload))
+        reply_type, reply = self._recv_message()
+        if reply_type == MSG_ERROR:
+            raise ControlProtocolError(reply.decode("utf-8"))
+        overlay_id, = OVERLAY_ID.unpack(reply)
+        return overlay_id
+
+    def push_overlay(self, matrix_id: str, data: bytes, *, row: int, col: int = 0, rows: int, cols: int = LED_MATRIX_COLS, priority: int = 0, ttl: float = 0) -> int:
+        info = OVERLAY_INFO.pack(priority, int(ttl * 1000), row, col, rows, cols)
+        return self._request(MSG_OVERLAY, pack_str(matrix_id) + info + data)
+
+    def remove_overlay(self, overlay_id: int) -> bool:
+        return self._request(MSG_REMOVE, OVERLAY_ID.pack(overlay_id)) == 1
+
+    def subscribe(self, matrix_id: str = "") -> Iterator[tuple[str, bytes]]:
+        _ = self._request(MSG_SUBSCRIBE, pack_str(matrix_id))
+        while True:
+            msg_type, payload = self._recv_message()
+            if msg_type != MSG_FRAME:
+                continue
+            frame_matrix_id, offset = unpack_str(payload)
+            yield frame_matrix_id, payload[offset:]
@@ -1,8 +1,9 @@
 from typing import override
 
 from fwui.ledmatrix import LED_MATRIX_COLS
-from .icons import parse_str_info, make_invalid_icon, USB2_ICON, USB3_ICON
-from .render import BLANK_ROW, RenderInfo, RenderResult, make_roman_numeral_str
+from .iconpack import DeviceKind, PackedDevice, ICON_ROWS
+from .icons import Icon, get_icon_pack, get_invalid_icon, get_named_icon
+from .render import BLANK_ROW, RenderInfo, RenderResult, make_roman_numeral_str, make_row_bar
 from abc import ABC, abstractmethod
 
 # All icons should be 9x8 pixels
@@ -28,28 +29,38 @@ class USBDeviceIDMatcher(DeviceMatcher):
         return info.usb.vid == self.vid and info.usb.pid == self.pid
 
 class Device:
+    # Volatile devices depend on more than the port records in RenderInfo
+    # and have to be re-rendered every frame, even if the generation did not change
+    volatile: bool = False
+
     def render(self, info: RenderInfo) -> RenderResult | None:
         return None
 
 class DeviceIcon(Device):
-    icon: list[int]
+    icon: Icon
+    _result: RenderResult
 
-    def __init__(self, icon: list[int]):
+    def __init__(self, icon: Icon):
         super().__init__()
         self.icon = icon
+        self._result = RenderResult(data=icon)
 
     @override
     def render(self, info: RenderInfo) -> RenderResult | None:
-        return RenderResult(data=self.icon)
+        return self._result
 
 class ConnectionDevice(Device):
-    connected_icon: list[int]
-    disconnected_icon: list[int]
+    connected_icon: Icon
+    disconnected_icon: Icon
+    _connected_result: RenderResult
+    _disconnected_result: RenderResult
 
-    def __init__(self, connected_icon: list[int], disconnected_icon: list[int]):
+    def __init__(self, connected_icon: Icon, disconnected_icon: Icon):
         super().__init__()
         self.connected_icon = connected_icon
         self.disconnected_icon = disconnected_icon
+        self._connected_result = RenderResult(data=connected_icon)
+        self._disconnected_result = RenderResult(data=disconnected_icon)
 
     def is_connected(self, info: RenderInfo) -> bool:
         raise NotImplementedError()
@@ -57,17 +68,17 @@ class ConnectionDevice(Device):
     @override
     def render(self, info: RenderInfo) -> RenderResult | None:
         if self.is_connected(info):
-            return RenderResult(data=self.connected_icon)
-        return RenderResult(data=self.disconnected_icon)
+            return self._connected_result
+        return self._disconnected_result
 
 class DisplayDevice(ConnectionDevice):
-    invalid_icon: list[int]
+    invalid_icon: Icon
+    _invalid_result: RenderResult
 
-    def __init__(self, connected_icon: list[int], disconnected_icon: list[int], invalid_icon: list[int] | None):
+    def __init__(self, connected_icon: Icon, disconnected_icon: Icon, invalid_icon: Icon | None = None):
         super().__init__(connected_icon=connected_icon, disconnected_icon=disconnected_icon)
-        if not invalid_icon:
-            invalid_icon = make_invalid_icon(connected_icon)
-        self.invalid_icon = invalid_icon
+        self.invalid_icon = invalid_icon or get_invalid_icon(connected_icon)
+        self._invalid_result = RenderResult(data=self.invalid_icon, allow_sleep=False)
 
     @override
     def is_connected(self, info: RenderInfo) -> bool:
@@ -78,120 +89,57 @@ class DisplayDevice(ConnectionDevice):
     @override
     def render(self, info: RenderInfo) -> RenderResult | None:
         if not info.display:
-            return RenderResult(data=self.invalid_icon, allow_sleep=False)
+            return self._invalid_result
         return super().render(info)
 
 class EthernetDevice(ConnectionDevice):
+    volatile = True
+
     @override
     def is_connected(self, info: RenderInfo) -> bool:
         if not info.usb:
             return False
         return info.usb.read_str_subfile("*/net/*/operstate") == "up"
 
-_ETHERNET_DEVICE = EthernetDevice(
-    connected_icon=parse_str_info(
-        " ####### " +
-        " # # # # " +
-        " # # # # " +
-        " #     # " +
-        " #     # " +
-        " #     # " +
-        " ##   ## " +
-        "  #####  "
-    ),
-    disconnected_icon=parse_str_info(
-        " ####### " +
-        " # 3 3 # " +
-        " # 3 3 # " +
-        " #     # " +
-        " #     # " +
-        " #     # " +
-        " ##   ## " +
-        "  #####  "
-    ),
-)
-
-_AUDIO_DEVICE = DeviceIcon(parse_str_info(
-    "      #  " +
-    "     ##  " +
-    "  ### #  " +
-    "  #   #  " +
-    "  #   #  " +
-    "  ### #  " +
-    "     ##  " +
-    "      #  "
-))
-
-_SD_DEVICE = DeviceIcon(parse_str_info(
-    " #####   " +
-    " #    #  " +
-    " ##    # " +
-    "  #    # " +
-    " #     # " +
-    " #     # " +
-    " #     # " +
-    " ####### "
-))
-
-_MICROSD_DEVICE = DeviceIcon(parse_str_info(
-    "  ####   " +
-    "  #   #  " +
-    "  #   #  " +
-    "  #    # " +
-    "  #   #  " +
-    "  #    # " +
-    "  #    # " +
-    "  ###### "
-))
-
-_DISPLAY_PORT_DEVICE = DisplayDevice(
-    connected_icon=parse_str_info(
-        "   ####  " +
-        "  #   #  " +
-        "  ### #  " +
-        "  # # #  " +
-        "  # # #  " +
-        "  ### #  " +
-        "  #   #  " +
-        "  #####  "
-    ),
-    disconnected_icon=parse_str_info(
-        "   ####  " +
-        "  #   #  " +
-        "  #33 #  " +
-        "  # 3 #  " +
-        "  # 3 #  " +
-        "  #33 #  " +
-        "  #   #  " +
-        "  #####  "
-    ),
-    invalid_icon=None,
-)
-
-_HDMI_DEVICE = DisplayDevice(
-    connected_icon=parse_str_info(
-        "   ####  " +
-        "  #   #  " +
-        "  # # #  " +
-        "  # # #  " +
-        "  # # #  " +
-        "  # # #  " +
-        "  #   #  " +
-        "   ####  "
-    ),
-    disconnected_icon=parse_str_info(
-        "   ####  " +
-        "  #   #  " +
-        "  # 3 #  " +
-        "  # 3 #  " +
-        "  # 3 #  " +
-        "  # 3 #  " +
-        "  #   #  " +
-        "   ####  "
-    ),
-    invalid_icon=None,
-)
+def _make_packed_device(packed: PackedDevice) -> Device:
+    pack = get_icon_pack()
+    icons = [Icon.of(pack.icon(index)) for index in packed.icons]
+    match packed.kind:
+        case DeviceKind.ICON:
+            return DeviceIcon(icons[0])
+        case DeviceKind.ETHERNET:
+            return EthernetDevice(connected_icon=icons[0], disconnected_icon=icons[1])
+        case DeviceKind.DISPLAY:
+            return DisplayDevice(connected_icon=icons[0], disconnected_icon=icons[1], invalid_icon=icons[2])
+
+class IconPackDevice(Device):
+    # Devices are only instantiated once a matching USB device shows up,
+    # so unused icon pack entries never leave the mmap
+    volatile = True
+    _devices: dict[tuple[int, int], Device | None]
+
+    def __init__(self):
+        super().__init__()
+        self._devices = {}
+
+    def _get_device(self, vid: int, pid: int) -> Device | None:
+        key = (vid, pid)
+        if key in self._devices:
+            return self._devices[key]
+
+        packed = get_icon_pack().find_device(vid, pid)
+        device = _make_packed_device(packed) if packed else None
+        self._devices[key] = device
+        return device
 
+    @override
+    def render(self, info: RenderInfo) -> RenderResult | None:
+        if not info.usb:
+            return None
+        device = self._get_device(info.usb.vid, info.usb.pid)
+        if not device:
+            return None
+        return device.render(info)
 
 class ChargeMatcher(DeviceMatcher):
     @override
@@ -204,6 +152,8 @@ class ChargeMatcher(DeviceMatcher):
             return False
         return True
 
+CHARGE_BAR_MAX_WATTS = 100.0
+
 class ChargeDevice(Device):
     xit: int = 0
     @override
@@ -246,7 +196,94 @@ class ChargeDevice(Device):
         self.xit += 1
         if self.xit > 100:
             self.xit = 0
-        return RenderResult(data=data)
+        return RenderResult(data=Icon.of(data), level=min((voltage * current) / CHARGE_BAR_MAX_WATTS, 1.0))
+
+class PowerSparklineDevice(Device):
+    # Power of the last LED_MATRIX_COLS samples, newest on the right, scaled to the peak
+    volatile = True
+
+    @override
+    def render(self, info: RenderInfo) -> RenderResult | None:
+        if not info.charge or not info.telemetry:
+            return None
+        if info.charge.voltage == 0:
+            return None
+
+        values = [abs(value) for value in info.telemetry.power.values(LED_MATRIX_COLS)]
+        if not values:
+            return None
+        peak = max(max(values), 1.0)
+
+        data: list[int] = BLANK_ROW * ICON_ROWS
+        xoffset = LED_MATRIX_COLS - len(values)
+        for x, value in enumerate(values):
+            height = max(round((value / peak) * ICON_ROWS), 1 if value > 0 else 0)
+            for y in range(height):
+                data[((ICON_ROWS - 1 - y) * LED_MATRIX_COLS) + xoffset + x] = 0xFF if y == height - 1 else 0x33
+
+        return RenderResult(data=Icon.of(data), level=min(values[-1] / CHARGE_BAR_MAX_WATTS, 1.0))
+
+class AveragePowerDevice(Device):
+    # Average power over the window as a thick bar, peak power as a dim bar below it
+    volatile = True
+    window: int | None
+
+    def __init__(self, window: int | None = None):
+        super().__init__()
+        self.window = window
+
+    @override
+    def render(self, info: RenderInfo) -> RenderResult | None:
+        if not info.charge or not info.telemetry:
+            return None
+        if info.charge.voltage == 0:
+            return None
+
+        power = info.telemetry.power
+        mean = abs(power.mean(self.window) or 0.0)
+        peak = max(abs(power.min(self.window) or 0.0), abs(power.max(self.window) or 0.0))
+
+        scale = LED_MATRIX_COLS / CHARGE_BAR_MAX_WATTS
+        data = make_row_bar(mean * scale, ICON_ROWS - 2) + BLANK_ROW + [value // 4 for value in make_row_bar(peak * scale)]
+        return RenderResult(data=Icon.of(data), level=min(mean / CHARGE_BAR_MAX_WATTS, 1.0))
+
+class USB4Matcher(DeviceMatcher):
+    @override
+    def matches(self, info: RenderInfo) -> bool:
+        return bool(info.usb4 and info.usb4.router)
+
+def _add_tunnel_markers(src: bytes, dp_tunnel: bool, pcie_tunnel: bool) -> list[int]:
+    data = list(src)
+    for y in range(3):
+        if dp_tunnel:
+            data[y * LED_MATRIX_COLS] = 0xFF
+        if pcie_tunnel:
+            data[(y * LED_MATRIX_COLS) + LED_MATRIX_COLS - 1] = 0xFF
+    return data
+
+class USB4Device(Device):
+    # USB4 icon with markers for active tunnels, DP on the left edge and PCIe on the right edge
+    _results: dict[tuple[bool, bool], RenderResult]
+
+    def __init__(self):
+        super().__init__()
+        self._results = {}
+
+    def _get_result(self, dp_tunnel: bool, pcie_tunnel: bool) -> RenderResult:
+        key = (dp_tunnel, pcie_tunnel)
+        res = self._results.get(key, None)
+        if not res:
+            res = RenderResult(data=get_named_icon("usb4").derive(key, lambda src: _add_tunnel_markers(src, dp_tunnel, pcie_tunnel)))
+            self._results[key] = res
+        return res
+
+    @override
+    def render(self, info: RenderInfo) -> RenderResult | None:
+        if not info.usb4:
+            return None
+        # DisplayPort over a USB4 link is always tunneled
+        dp_tunnel = info.usb4.active and bool(info.display and info.display.connected)
+        return self._get_result(dp_tunnel, info.usb4.pcie_tunnel)
 
 class AnyUSBMatcher(DeviceMatcher):
     @override
@@ -255,14 +292,27 @@ class AnyUSBMatcher(DeviceMatcher):
 
 
 class AnyUSBDevice(Device):
+    _results: dict[str, RenderResult]
+
+    def __init__(self):
+        super().__init__()
+        self._results = {}
+
+    def _get_result(self, icon_name: str) -> RenderResult:
+        res = self._results.get(icon_name, None)
+        if not res:
+            res = RenderResult(data=get_named_icon(icon_name))
+            self._results[icon_name] = res
+        return res
+
     @override
     def render(self, info: RenderInfo) -> RenderResult | None:
         if not info.usb:
             return None
         speed = info.usb.speed
         if speed and speed >= 5000:
-            return RenderResult(data=USB3_ICON)
-        return RenderResult(data=USB2_ICON)
+            return self._get_result("usb3")
+        return self._get_result("usb2")
 
 DEVICE_MATCHERS: list[tuple[DeviceMatcher, Device]] = []
 
@@ -271,14 +321,24 @@ def add_matcher(matcher: DeviceMatcher, device: Device):
 
 # Define devices below
 
-add_matcher(ChargeMatcher(), ChargeDevice()) # Always first
+_CHARGE_MATCHER = ChargeMatcher()
+CHARGE_STYLES: dict[str, Device] = {
+    "numerals": ChargeDevice(),
+    "sparkline": PowerSparklineDevice(),
+    "average": AveragePowerDevice(),
+}
+
+def set_charge_style(style: str) -> None:
+    device = CHARGE_STYLES[style]
+    for i, (matcher, _) in enumerate(DEVICE_MATCHERS):
+        if matcher is _CHARGE_MATCHER:
+            DEVICE_MATCHERS[i] = (matcher, device)
+
+add_matcher(_CHARGE_MATCHER, CHARGE_STYLES["numerals"]) # Always first
 
-add_matcher(USBDeviceIDMatcher(vid=0x32ac, pid=0x0010), _AUDIO_DEVICE)
-add_matcher(USBDeviceIDMatcher(vid=0x0bda, pid=0x8156), _ETHERNET_DEVICE)
-add_matcher(USBDeviceIDMatcher(vid=0x32ac, pid=0x0009), _SD_DEVICE)
-add_matcher(USBDeviceIDMatcher(vid=0x090c, pid=0x1000), _MICROSD_DEVICE)
+add_matcher(USB4Matcher(), USB4Device())
 
-add_matcher(USBDeviceIDMatcher(vid=0x32ac, pid=0x0002), _HDMI_DEVICE)
-add_matcher(USBDeviceIDMatcher(vid=0x32ac, pid=0x0003), _DISPLAY_PORT_DEVICE)
+# USB devices by vid/pid are defined in the icon pack (see icons.yml)
+add_matcher(AnyUSBMatcher(), IconPackDevice())
 
 add_matcher(AnyUSBMatcher(), AnyUSBDevice()) # Always last
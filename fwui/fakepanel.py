@@ -0,0 +1,68 @@
+from .ledmatrix import LED_MATRIX_PIXELS
+
+# In-memory stand-in for the serial port of an LED matrix, decodes every
+# command the same way the panel firmware does. Pass it to LEDMatrix instead
+# of a serial device path, or set "serial: fake" for a matrix in config.yml.
+
+COMMAND_SIZES = {
+    b'w'[0]: 1,
+    b's'[0]: 1,
+    b'm'[0]: LED_MATRIX_PIXELS,
+    b'n'[0]: LED_MATRIX_PIXELS,
+}
+
+class FakePanel:
+    pixels: bytes
+    brightness: int
+    sleeping: bool
+    frames: int
+    bytes_received: int
+    _buffer: bytearray
+    _acks: bytearray
+
+    def __init__(self):
+        super().__init__()
+        self.pixels = bytes(LED_MATRIX_PIXELS)
+        self.brightness = 0
+        self.sleeping = False
+        self.frames = 0
+        self.bytes_received = 0
+        self._buffer = bytearray()
+        self._acks = bytearray()
+
+    def write(self, b: bytes, /) -> int | None:
+        self.bytes_received += len(b)
+        self._buffer += b
+        while self._buffer:
+            command = self._buffer[0]
+            size = COMMAND_SIZES.get(command | 0x20, None)
+            if size is None:
+                raise ValueError(f"Unknown command {bytes([command])}")
+            if len(self._buffer) < size + 1:
+                break
+            self._execute(command, bytes(self._buffer[1:size + 1]))
+            del self._buffer[:size + 1]
+        return len(b)
+
+    def _execute(self, command: int, payload: bytes) -> None:
+        lower = command | 0x20
+        if lower == b'w'[0]:
+            self.sleeping = payload[0] != 0
+        elif lower == b's'[0]:
+            self.brightness = payload[0]
+        elif lower == b'm'[0]:
+            self.pixels = payload
+            self.frames += 1
+        elif lower == b'n'[0]:
+            # Without PWM every non-zero pixel is fully on
+            self.pixels = bytes(0xFF if value else 0x00 for value in payload)
+            self.frames += 1
+
+        # Uppercase commands are blocking and acknowledged with the command character
+        if not command & 0x20:
+            self._acks.append(command)
+
+    def read(self, size: int = 1, /) -> bytes:
+        data = bytes(self._acks[:size])
+        del self._acks[:size]
+        return data
@@ -0,0 +1,149 @@
+from dataclasses import dataclass
+from enum import IntEnum
+from mmap import mmap, ACCESS_READ
+from os import fstat
+from struct import Struct
+
+# Binary icon pack layout (all integers little endian):
+#   header
+#   icon records (icon_count * ICON_SIZE bytes, 9x8 greyscale)
+#   name table (name_count * NAME_ENTRY, sorted by name)
+#   device index (device_count * DEVICE_ENTRY, sorted by (vid, pid))
+
+PACK_MAGIC = b"FWIP"
+PACK_VERSION = 1
+
+ICON_COLS = 9
+ICON_ROWS = 8
+ICON_SIZE = ICON_COLS * ICON_ROWS
+
+NAME_MAX_LEN = 16
+NO_ICON = 0xFFFF
+DEVICE_ICON_SLOTS = 3
+
+HEADER = Struct("<4sHHIII") # magic, version, record size, icon count, name count, device count
+NAME_ENTRY = Struct(f"<{NAME_MAX_LEN}sI") # name, icon index
+DEVICE_ENTRY = Struct(f"<HHBx{DEVICE_ICON_SLOTS}H") # vid, pid, kind, icon indices
+
+class DeviceKind(IntEnum):
+    ICON = 0
+    ETHERNET = 1
+    DISPLAY = 2
+
+@dataclass(kw_only=True, frozen=True)
+class PackedDevice:
+    vid: int
+    pid: int
+    kind: DeviceKind
+    icons: tuple[int, ...]
+
+class IconPackError(ValueError):
+    pass
+
+def _encode_name(name: str) -> bytes:
+    raw = name.encode("utf-8")
+    if len(raw) > NAME_MAX_LEN:
+        raise IconPackError(f"Icon name too long (max {NAME_MAX_LEN} bytes): {name}")
+    return raw
+
+def build_icon_pack(icons: list[bytes], names: dict[str, int], devices: list[PackedDevice]) -> bytes:
+    if len(icons) >= NO_ICON:
+        raise IconPackError(f"Too many icons: {len(icons)}")
+
+    out = bytearray(HEADER.pack(PACK_MAGIC, PACK_VERSION, ICON_SIZE, len(icons), len(names), len(devices)))
+
+    for icon in icons:
+        if len(icon) != ICON_SIZE:
+            raise IconPackError(f"Invalid icon size expected={ICON_SIZE} actual={len(icon)}")
+        out += icon
+
+    for raw_name, index in sorted((_encode_name(name), index) for name, index in names.items()):
+        out += NAME_ENTRY.pack(raw_name, index)
+
+    seen: set[tuple[int, int]] = set()
+    for dev in sorted(devices, key=lambda d: (d.vid, d.pid)):
+        if (dev.vid, dev.pid) in seen:
+            raise IconPackError(f"Duplicate device {dev.vid:04x}:{dev.pid:04x}")
+        seen.add((dev.vid, dev.pid))
+        if len(dev.icons) > DEVICE_ICON_SLOTS:
+            raise IconPackError(f"Too many icons for device {dev.vid:04x}:{dev.pid:04x}")
+        icon_slots = list(dev.icons) + [NO_ICON] * (DEVICE_ICON_SLOTS - len(dev.icons))
+        out += DEVICE_ENTRY.pack(dev.vid, dev.pid, dev.kind, *icon_slots)
+
+    return bytes(out)
+
+class IconPack:
+    _map: mmap
+    _view: memoryview
+    icon_count: int
+    name_count: int
+    device_count: int
+    _names_offset: int
+    _devices_offset: int
+
+    def __init__(self, pack_path: str):
+        super().__init__()
+        with open(pack_path, "rb") as f:
+            # mmap refuses empty files
+            if fstat(f.fileno()).st_size < HEADER.size:
+                raise IconPackError(f"Icon pack {pack_path} is truncated")
+            self._map = mmap(f.fileno(), 0, access=ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        magic, version, record_size, self.icon_count, self.name_count, self.device_count = HEADER.unpack_from(self._view)
+        if magic != PACK_MAGIC:
+            raise IconPackError(f"Icon pack {pack_path} has invalid magic {magic}")
+        if version != PACK_VERSION:
+            raise IconPackError(f"Icon pack {pack_path} has unsupported version {version}")
+        if record_size != ICON_SIZE:
+            raise IconPackError(f"Icon pack {pack_path} has invalid record size {record_size}")
+
+        self._names_offset = HEADER.size + self.icon_count * ICON_SIZE
+        self._devices_offset = self._names_offset + self.name_count * NAME_ENTRY.size
+        expected_size = self._devices_offset + self.device_count * DEVICE_ENTRY.size
+        if len(self._view) != expected_size:
+            raise IconPackError(f"Icon pack {pack_path} has invalid size expected={expected_size} actual={len(self._view)}")
+
+    def icon(self, index: int) -> memoryview:
+        if index < 0 or index >= self.icon_count:
+            raise IndexError(f"Icon index {index} out of range")
+        start = HEADER.size + index * ICON_SIZE
+        return self._view[start:start + ICON_SIZE]
+
+    def named_icon(self, name: str) -> memoryview | None:
+        raw_name = _encode_name(name).ljust(NAME_MAX_LEN, b"\x00")
+        lo = 0
+        hi = self.name_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = self._names_offset + mid * NAME_ENTRY.size
+            entry_name = self._view[offset:offset + NAME_MAX_LEN].tobytes()
+            if entry_name == raw_name:
+                _, index = NAME_ENTRY.unpack_from(self._view, offset)
+                return self.icon(index)
+            if entry_name < raw_name:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def find_device(self, vid: int, pid: int) -> PackedDevice | None:
+        key = (vid, pid)
+        lo = 0
+        hi = self.device_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry_vid, entry_pid, kind, *icon_slots = DEVICE_ENTRY.unpack_from(self._view, self._devices_offset + mid * DEVICE_ENTRY.size)
+            entry_key = (entry_vid, entry_pid)
+            if entry_key == key:
+                return PackedDevice(
+                    vid=entry_vid,
+                    pid=entry_pid,
+                    kind=DeviceKind(kind),
+                    icons=tuple(i for i in icon_slots if i != NO_ICON),
+                )
+            if entry_key < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
@@ -1,3 +1,12 @@
+from collections.abc import Callable, Sequence
+from os import path, replace
+from sys import argv
+from threading import Lock
+from typing import Any, ClassVar, cast, override
+from weakref import WeakValueDictionary
+from yaml import safe_load as yaml_load
+from .iconpack import IconPack, IconPackError, PackedDevice, DeviceKind, build_icon_pack, ICON_COLS, ICON_ROWS, ICON_SIZE
+
 # All icons should be 9x8 pixels
 
 def parse_str_info(src: str) -> list[int]:
@@ -40,66 +49,228 @@ def parse_str_info(src: str) -> list[int]:
 
     return res
 
-USB2_ICON = parse_str_info(
-    "   ###   " +
-    "  #   #  " +
-    "      #  " +
-    "     #   " +
-    "    #    " +
-    "   #     " +
-    "  #      " +
-    "  #####  "
-)
-
-USB3_ICON = parse_str_info(
-    "   ###   " +
-    "  #   #  " +
-    "      #  " +
-    "    ##   " +
-    "      #  " +
-    "      #  " +
-    "  #   #  " +
-    "   ###   "
-)
-
-USB4_ICON = parse_str_info(
-    "     #   " +
-    "    ##   " +
-    "   # #   " +
-    "  #  #   " +
-    "  #  #   " +
-    "  #####  " +
-    "     #   " +
-    "     #   "
-)
-
-_CROSS = parse_str_info(
-    " #     # " +
-    "  #   #  " +
-    "   # #   " +
-    "    #    " +
-    "    #    " +
-    "   # #   " +
-    "  #   #  " +
-    " #     # "
-)
-
-EMPTY_ICON = parse_str_info(
-    "         " +
-    "         " +
-    "         " +
-    "         " +
-    "         " +
-    "         " +
-    "         " +
-    "         "
-)
-
-def make_invalid_icon(src: list[int]) -> list[int]:
-    icon = src.copy()
-    for i, x in enumerate(_CROSS):
+class Icon:
+    # Immutable 9x8 icon. Instances are interned, so two icons with the same
+    # pixels are the same object and comparing them is an identity check.
+    data: bytes
+    _hash: int
+    _derived: dict[object, "Icon"]
+
+    _registry: ClassVar[WeakValueDictionary[bytes, "Icon"]] = WeakValueDictionary()
+    _registry_lock: ClassVar[Lock] = Lock()
+
+    def __init__(self, data: bytes):
+        super().__init__()
+        if len(data) != ICON_SIZE:
+            raise ValueError(f"Invalid icon size expected={ICON_SIZE} actual={len(data)}")
+        self.data = data
+        self._hash = hash(data)
+        self._derived = {}
+
+    @classmethod
+    def of(cls, src: Sequence[int] | bytes | memoryview) -> "Icon":
+        data = bytes(src)
+        with cls._registry_lock:
+            icon = cls._registry.get(data, None)
+            if icon is None:
+                icon = cls(data)
+                cls._registry[data] = icon
+        return icon
+
+    @override
+    def __eq__(self, other: object) -> bool:
+        # Interned icons compare by identity, this only matters for icons built with Icon() directly
+        if self is other:
+            return True
+        if not isinstance(other, Icon):
+            return NotImplemented
+        return self._hash == other._hash and self.data == other.data
+
+    @override
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __len__(self) -> int:
+        return ICON_SIZE
+
+    def derive(self, key: object, make: Callable[[bytes], Sequence[int]]) -> "Icon":
+        # Memoized derived icon, make is only called once per key
+        icon = self._derived.get(key, None)
+        if icon is None:
+            icon = Icon.of(make(self.data))
+            self._derived[key] = icon
+        return icon
+
+EMPTY_ICON = Icon.of(bytes(ICON_SIZE))
+
+def make_invalid_icon(src: Sequence[int], cross: Sequence[int]) -> list[int]:
+    icon = list(src)
+    for i, x in enumerate(cross):
         if x:
             icon[i] = x
         else:
             icon[i] //= 4
     return icon
+
+# Icon source files (YAML) look like this:
+#
+# icons:
+#   usb2: ["   ###   ", "  #   #  ", ...] # 8 rows of 9 columns
+# devices:
+#   - name: framework-audio
+#     match: usb_id
+#     vid: 0x32ac
+#     pid: 0x0010
+#     type: icon # icon, ethernet or display
+#     icons:
+#       icon: ["      #  ", ...] # or the name of an entry in icons
+#
+# ethernet devices take "connected" and "disconnected" icons, display devices
+# additionally take an optional "invalid" icon (derived from "connected" if missing)
+
+DEVICE_ICON_NAMES: dict[DeviceKind, tuple[str, ...]] = {
+    DeviceKind.ICON: ("icon",),
+    DeviceKind.ETHERNET: ("connected", "disconnected"),
+    DeviceKind.DISPLAY: ("connected", "disconnected", "invalid"),
+}
+
+class _IconPackCompiler:
+    icons: list[bytes]
+    icon_indices: dict[bytes, int]
+    names: dict[str, int]
+    devices: list[PackedDevice]
+
+    def __init__(self):
+        super().__init__()
+        self.icons = []
+        self.icon_indices = {}
+        self.names = {}
+        self.devices = []
+
+    def add_icon(self, icon: Sequence[int]) -> int:
+        data = bytes(icon)
+        index = self.icon_indices.get(data, None)
+        if index is None:
+            index = len(self.icons)
+            self.icons.append(data)
+            self.icon_indices[data] = index
+        return index
+
+    def parse_icon(self, src: Any, where: str) -> list[int]:
+        if isinstance(src, str):
+            index = self.names.get(src, None)
+            if index is None:
+                raise ValueError(f"{where}: Unknown icon {src}")
+            return list(self.icons[index])
+
+        if not isinstance(src, list):
+            raise ValueError(f"{where}: Icon must be a name or a list of rows")
+        rows = cast(list[Any], src)
+        if len(rows) != ICON_ROWS:
+            raise ValueError(f"{where}: Icon must have {ICON_ROWS} rows")
+        res: list[int] = []
+        for row in rows:
+            if not isinstance(row, str) or len(row) != ICON_COLS:
+                raise ValueError(f"{where}: Icon rows must be strings of {ICON_COLS} characters")
+            res += parse_str_info(row)
+        if len(res) != ICON_SIZE:
+            raise ValueError(f"{where}: Icon contains invalid characters")
+        return res
+
+    def add_source(self, source_path: str) -> None:
+        with open(source_path, "r") as f:
+            source: dict[str, Any] = yaml_load(f) or {}
+
+        icons: dict[str, Any] = source.get("icons") or {}
+        for name, icon in icons.items():
+            if name in self.names:
+                raise ValueError(f"{source_path}: Duplicate icon {name}")
+            self.names[name] = self.add_icon(self.parse_icon(icon, f"{source_path}: icon {name}"))
+
+        devices: list[dict[str, Any]] = source.get("devices") or []
+        for dev in devices:
+            where = f"{source_path}: device {dev.get('name', '?')}"
+            matcher = dev.get("match", "usb_id")
+            if matcher != "usb_id":
+                raise ValueError(f"{where}: Unsupported matcher {matcher}")
+            kind = DeviceKind[str(dev.get("type", "icon")).upper()]
+            dev_icons: dict[str, Any] = dev.get("icons") or {}
+
+            parsed: list[list[int]] = []
+            for icon_name in DEVICE_ICON_NAMES[kind]:
+                icon = dev_icons.get(icon_name, None)
+                if icon is not None:
+                    parsed.append(self.parse_icon(icon, f"{where}: {icon_name}"))
+                elif icon_name == "invalid":
+                    parsed.append(make_invalid_icon(parsed[0], self.parse_icon("cross", where)))
+                else:
+                    raise ValueError(f"{where}: Missing icon {icon_name}")
+
+            self.devices.append(PackedDevice(
+                vid=int(dev["vid"]),
+                pid=int(dev["pid"]),
+                kind=kind,
+                icons=tuple(self.add_icon(icon) for icon in parsed),
+            ))
+
+    def build(self) -> bytes:
+        return build_icon_pack(self.icons, self.names, self.devices)
+
+def compile_icon_pack(source_paths: list[str], pack_path: str) -> None:
+    compiler = _IconPackCompiler()
+    for source_path in source_paths:
+        compiler.add_source(source_path)
+
+    tmp_path = f"{pack_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        _ = f.write(compiler.build())
+    replace(tmp_path, pack_path)
+
+def _icon_pack_is_stale(source_paths: list[str], pack_path: str) -> bool:
+    if not path.exists(pack_path):
+        return True
+    pack_mtime = path.getmtime(pack_path)
+    # Sources may be missing when only the compiled pack is deployed
+    return any(path.getmtime(source_path) > pack_mtime for source_path in source_paths if path.exists(source_path))
+
+_icon_pack: IconPack | None = None
+_named_icons: dict[str, Icon] = {}
+
+def load_icon_pack(pack_path: str, source_paths: list[str]) -> IconPack:
+    global _icon_pack
+    if _icon_pack_is_stale(source_paths, pack_path):
+        compile_icon_pack(source_paths, pack_path)
+        _icon_pack = IconPack(pack_path)
+    else:
+        try:
+            _icon_pack = IconPack(pack_path)
+        except IconPackError:
+            # Written by a version with another pack format (or damaged), rebuild it
+            compile_icon_pack(source_paths, pack_path)
+            _icon_pack = IconPack(pack_path)
+    _named_icons.clear()
+    return _icon_pack
+
+def get_icon_pack() -> IconPack:
+    if not _icon_pack:
+        raise RuntimeError("Icon pack not loaded")
+    return _icon_pack
+
+def get_named_icon(name: str) -> Icon:
+    icon = _named_icons.get(name, None)
+    if icon is None:
+        data = get_icon_pack().named_icon(name)
+        if data is None:
+            raise KeyError(f"Icon {name} not found in icon pack")
+        icon = Icon.of(data)
+        _named_icons[name] = icon
+    return icon
+
+def get_invalid_icon(icon: Icon) -> Icon:
+    return icon.derive("invalid", lambda data: make_invalid_icon(data, get_named_icon("cross").data))
+
+if __name__ == "__main__":
+    if len(argv) < 3:
+        print("Usage: python -m fwui.icons OUTPUT.pack SOURCE.yml...")
+        exit(1)
+    compile_icon_pack(argv[2:], argv[1])
@@ -0,0 +1,106 @@
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any
+from .iconpack import ICON_COLS, ICON_ROWS
+from .icons import EMPTY_ICON
+from .ledmatrix import LED_MATRIX_COLS, LED_MATRIX_ROWS
+from .render import RenderResult, SEPARATOR_PIXEL, make_row_bar
+
+class SlotKind(Enum):
+    ICON = "icon"
+    BAR = "bar"
+
+@dataclass(kw_only=True, frozen=True)
+class SlotConfig:
+    row: int
+    rows: int = field(default=ICON_ROWS)
+    col: int = field(default=0)
+    cols: int = field(default=LED_MATRIX_COLS)
+    kind: SlotKind = field(default=SlotKind.ICON)
+    # Separator line two rows above and below the slot, with one blank row of padding
+    separator: bool = field(default=False)
+
+# Matches the classic layout of three 9x8 icons separated by lines
+DEFAULT_LAYOUT = [SlotConfig(row=2 + (pos * 11), separator=True) for pos in range(3)]
+
+# (src start, src end, dst start, dst end), src indexes the slot's source buffer
+# (an icon or a bar) and dst the LED_MATRIX_COLS wide frame
+BlitSpan = tuple[int, int, int, int]
+
+def _make_spans(src_stride: int, src_row: int, src_col: int, dst_row: int, dst_col: int, rows: int, cols: int) -> tuple[BlitSpan, ...]:
+    spans: list[BlitSpan] = []
+    for y in range(rows):
+        src_start = ((src_row + y) * src_stride) + src_col
+        dst_start = ((dst_row + y) * LED_MATRIX_COLS) + dst_col
+        spans.append((src_start, src_start + cols, dst_start, dst_start + cols))
+    return tuple(spans)
+
+class CompiledSlot:
+    config: SlotConfig
+    blits: tuple[BlitSpan, ...]
+    fills: tuple[tuple[int, int, bytes], ...]
+
+    def __init__(self, config: SlotConfig):
+        super().__init__()
+        self.config = config
+
+        top = config.row - 2 if config.separator else config.row
+        bottom = config.row + config.rows + (2 if config.separator else 0)
+        if config.rows <= 0 or config.cols <= 0:
+            raise ValueError(f"Slot must not be empty: {config}")
+        if top < 0 or bottom > LED_MATRIX_ROWS:
+            raise ValueError(f"Slot rows out of range: {config}")
+        if config.col < 0 or config.col + config.cols > LED_MATRIX_COLS:
+            raise ValueError(f"Slot columns out of range: {config}")
+
+        fills: list[tuple[int, int, bytes]] = []
+        if config.separator:
+            separator = bytes([SEPARATOR_PIXEL] * config.cols)
+            for sep_row in (top, bottom - 1):
+                dst_start = (sep_row * LED_MATRIX_COLS) + config.col
+                fills.append((dst_start, dst_start + config.cols, separator))
+        self.fills = tuple(fills)
+
+        match config.kind:
+            case SlotKind.ICON:
+                # Center the icon in the slot, cropping it if the slot is smaller
+                rows = min(config.rows, ICON_ROWS)
+                cols = min(config.cols, ICON_COLS)
+                self.blits = _make_spans(
+                    src_stride=ICON_COLS,
+                    src_row=(ICON_ROWS - rows) // 2,
+                    src_col=(ICON_COLS - cols) // 2,
+                    dst_row=config.row + ((config.rows - rows) // 2),
+                    dst_col=config.col,
+                    rows=rows,
+                    cols=cols,
+                )
+            case SlotKind.BAR:
+                # Bars are rendered by make_row_bar, which builds full LED_MATRIX_COLS wide rows
+                self.blits = _make_spans(src_stride=LED_MATRIX_COLS, src_row=0, src_col=0, dst_row=config.row, dst_col=config.col, rows=config.rows, cols=config.cols)
+
+    def draw(self, frame: bytearray, res: RenderResult) -> None:
+        for dst_start, dst_end, data in self.fills:
+            frame[dst_start:dst_end] = data
+
+        match self.config.kind:
+            case SlotKind.ICON:
+                src = (res.data or EMPTY_ICON).data
+            case SlotKind.BAR:
+                src = make_row_bar((res.level or 0.0) * self.config.cols, self.config.rows)
+
+        for src_start, src_end, dst_start, dst_end in self.blits:
+            frame[dst_start:dst_end] = src[src_start:src_end]
+
+def parse_slot_config(src: dict[str, Any]) -> SlotConfig:
+    return SlotConfig(
+        row=int(src["row"]),
+        rows=int(src.get("rows", ICON_ROWS)),
+        col=int(src.get("col", 0)),
+        cols=int(src.get("cols", LED_MATRIX_COLS)),
+        kind=SlotKind(src.get("kind", SlotKind.ICON.value)),
+        separator=bool(src.get("separator", False)),
+    )
+
+def compile_layout(slots: list[SlotConfig]) -> list[CompiledSlot]:
+    return [CompiledSlot(slot) for slot in slots]
@@ -1,37 +1,90 @@
+from collections import deque
 from serial import Serial
+from time import monotonic
+from typing import Protocol
 
 LED_MATRIX_COLS = 9
 LED_MATRIX_ROWS = 34
+LED_MATRIX_PIXELS = LED_MATRIX_ROWS * LED_MATRIX_COLS
+
+WIRE_STATS_SECONDS = 10.0
+
+class PanelPort(Protocol):
+    def write(self, b: bytes, /) -> int | None: ...
+    def read(self, size: int = 1, /) -> bytes: ...
+
+class WireStats:
+    _samples: deque[tuple[float, int]]
+
+    def __init__(self):
+        super().__init__()
+        self._samples = deque()
+
+    def add(self, size: int) -> None:
+        now = monotonic()
+        self._samples.append((now, size))
+        while self._samples and self._samples[0][0] < now - WIRE_STATS_SECONDS:
+            _ = self._samples.popleft()
+
+    def bytes_per_second(self) -> float:
+        now = monotonic()
+        return sum(size for ts, size in self._samples if ts >= now - WIRE_STATS_SECONDS) / WIRE_STATS_SECONDS
 
 class LEDMatrix:
-    port: Serial
+    port: PanelPort
     is_cleared: bool = False
     id: str
+    wire_stats: WireStats
+    _pending_ack: bytes | None
 
-    def __init__(self, id: str, port: str):
+    def __init__(self, id: str, port: str | PanelPort):
         super().__init__()
         # Baudrate doesn't matter, those are CDC serial ports
         # which do not follow any baudrate
         self.id = id
-        self.port = Serial(port, timeout=5.0)
+        self.port = Serial(port, timeout=5.0) if isinstance(port, str) else port
+        self.wire_stats = WireStats()
+        self._pending_ack = None
         self.clear()
 
+    def _write(self, data: bytes) -> None:
+        _ = self.port.write(data)
+        self.wire_stats.add(len(data))
+
     def clear(self) -> None:
         if self.is_cleared:
             return
-        _ = self.port.write(b'w\x00')
-        _ = self.port.write(b's\x7F')
+        self._write(b'w\x00')
+        self._write(b's\x7F')
         self.is_cleared = True
 
-    def draw(self, bitmap: bytes, blocking: bool = True, pwm: bool = True) -> None:
-        if len(bitmap) != LED_MATRIX_ROWS * LED_MATRIX_COLS:
-            raise ValueError(f"Bitmap must be {LED_MATRIX_ROWS * LED_MATRIX_COLS} bytes long")
+    def _send(self, bitmap: bytes, pwm: bool, blocking: bool) -> bytes:
+        # Returns the command character
+        if len(bitmap) != LED_MATRIX_PIXELS:
+            raise ValueError(f"Bitmap must be {LED_MATRIX_PIXELS} bytes long")
 
+        self.wait_ack()
         self.is_cleared = False
 
         mode_char = b'm' if pwm else b'n'
         if blocking:
             mode_char = mode_char.upper()
-        _ = self.port.write(mode_char + bitmap)
+        self._write(mode_char + bitmap)
+        return mode_char
+
+    def draw(self, bitmap: bytes, blocking: bool = True, pwm: bool = True) -> None:
+        mode_char = self._send(bitmap, pwm, blocking)
         if blocking:
             assert self.port.read(1) == mode_char
+
+    def write_frame(self, bitmap: bytes, pwm: bool = True) -> None:
+        # Sends an acknowledged frame without waiting for the ack, so frames for
+        # several panels can be written back to back before collecting the acks with wait_ack
+        self._pending_ack = self._send(bitmap, pwm, True)
+
+    def wait_ack(self) -> None:
+        expected = self._pending_ack
+        if expected is None:
+            return
+        self._pending_ack = None
+        assert self.port.read(1) == expected
@@ -0,0 +1,72 @@
+from collections.abc import Callable
+from threading import Condition, Thread
+
+class LatestQueue[T]:
+    # Queue with a depth of 1, putting a new item replaces any item not yet consumed
+    _cond: Condition
+    _item: T | None
+    _error: BaseException | None
+    dropped: int
+
+    def __init__(self):
+        super().__init__()
+        self._cond = Condition()
+        self._item = None
+        self._error = None
+        self.dropped = 0
+
+    def put(self, item: T) -> None:
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._cond.notify()
+
+    def fail(self, error: BaseException) -> None:
+        with self._cond:
+            self._error = error
+            self._cond.notify()
+
+    def get(self) -> T:
+        with self._cond:
+            while self._item is None and self._error is None:
+                _ = self._cond.wait()
+            if self._error is not None:
+                raise self._error
+            item = self._item
+            self._item = None
+            assert item is not None
+            return item
+
+class Pipeline[T]:
+    # Two stage pipeline: the sampler builds frame N+1 in a background thread
+    # while the presenter is still busy sending frame N
+    _sample: Callable[[], T]
+    _present: Callable[[T], None]
+    _wait: Callable[[], None]
+    _queue: LatestQueue[T]
+
+    def __init__(self, sample: Callable[[], T], present: Callable[[T], None], wait: Callable[[], None]):
+        super().__init__()
+        self._sample = sample
+        self._present = present
+        self._wait = wait
+        self._queue = LatestQueue()
+
+    @property
+    def dropped_frames(self) -> int:
+        return self._queue.dropped
+
+    def _run_sampler(self) -> None:
+        try:
+            while True:
+                self._queue.put(self._sample())
+                self._wait()
+        except BaseException as e:
+            self._queue.fail(e)
+
+    def run(self) -> None:
+        sampler = Thread(target=self._run_sampler, name="sampler", daemon=True)
+        sampler.start()
+        while True:
+            self._present(self._queue.get())
@@ -1,13 +1,61 @@
+from dataclasses import dataclass, field
+from enum import Enum
 from os import path
 from glob import glob
-from typing import overload
+from time import monotonic
+from typing import ClassVar, overload
+from .reader import get_sysfs_reader
+
+SLOW_SAMPLE_SECONDS = 5.0
+
+class SampleRate(Enum):
+    IDENTITY = "identity" # Only re-read after a hotplug (see DevInfo.hotplug_key and DevInfo.invalidate)
+    SLOW = "slow" # At most every SLOW_SAMPLE_SECONDS
+    LIVE = "live" # On every sample
+
+@dataclass(kw_only=True, frozen=True, slots=True)
+class SamplePolicy:
+    rate: SampleRate = field(default=SampleRate.LIVE)
+    # Reads taking longer than this fall back to the last value (see reader.py), None reads directly
+    deadline: float | None = field(default=None)
+
+LIVE_POLICY = SamplePolicy()
 
 class DevInfo:
+    # Records are kept per port and updated in place on every sample,
+    # generation is bumped whenever any of the sampled values changed.
+    # stale is set when a deadline bound read had to fall back to its last value
+    __slots__ = ("devpath", "generation", "stale", "_cached", "_hotplug_key")
     devpath: str
+    generation: int
+    stale: bool
+    _cached: dict[str, tuple[float, bytes | None]]
+    _hotplug_key: object
+    # Attributes not listed are read on every sample without a deadline
+    sample_policy: ClassVar[dict[str, SamplePolicy]] = {}
 
     def __init__(self, devpath: str):
         super().__init__()
         self.devpath = devpath
+        self.generation = 0
+        self.stale = False
+        self._cached = {}
+        self._hotplug_key = None
+
+    def hotplug_key(self) -> object:
+        # Changes whenever the device behind devpath was (re)plugged
+        return None
+
+    def invalidate(self) -> None:
+        # Forces identity and slow attributes to be re-read
+        self._cached.clear()
+
+    def begin_sample(self) -> None:
+        self.stale = False
+        hotplug_key = self.hotplug_key()
+        if hotplug_key != self._hotplug_key:
+            self._hotplug_key = hotplug_key
+            self.invalidate()
 
     @overload
     def read_str_subfile(self, file: str, *, default: str) -> str: ...
@@ -21,6 +69,31 @@ class DevInfo:
         return value.decode("utf-8").strip()
 
     def read_subfile(self, file: str) -> bytes | None:
+        policy = self.sample_policy.get(file, LIVE_POLICY)
+        if policy.rate is SampleRate.LIVE:
+            return self._read_with_deadline(file, policy.deadline)[0]
+
+        now = monotonic()
+        cached = self._cached.get(file, None)
+        if cached and (policy.rate is SampleRate.IDENTITY or now - cached[0] < SLOW_SAMPLE_SECONDS):
+            return cached[1]
+
+        value, stale = self._read_with_deadline(file, policy.deadline)
+        if not stale:
+            self._cached[file] = (now, value)
+        return value
+
+    def _read_with_deadline(self, file: str, deadline: float | None) -> tuple[bytes | None, bool]:
+        reader = get_sysfs_reader()
+        if deadline is None or not reader:
+            return self._read_subfile(file), False
+
+        value, stale = reader.read(self.devpath, path.join(self.devpath, file), lambda: self._read_subfile(file), deadline)
+        if stale:
+            self.stale = True
+        return value, stale
+
+    def _read_subfile(self, file: str) -> bytes | None:
         devfile = path.join(self.devpath, file)
         globs = glob(devfile)
         if not globs:
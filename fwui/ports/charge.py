@@ -1,32 +1,62 @@
-from .base import DevInfo
-from functools import cached_property
+from typing import ClassVar
+from .base import DevInfo, SamplePolicy, SampleRate
+from .reader import READ_DEADLINE_SECONDS
 
 class ChargeInfo(DevInfo):
-    @cached_property
-    def current(self) -> float:
-        return self.read_int_subfile("current_now", default=0) / 1000000
-
-    @cached_property
-    def voltage(self) -> float:
-        return self.read_int_subfile("voltage_now", default=0) / 1000000
-
-    @cached_property
-    def online(self) -> bool:
-        return self.read_int_subfile("online") == 1
-    
-    @cached_property
-    def usb_type(self) -> str | None:
-        return self.read_str_subfile("usb_type")
+    __slots__ = ("current", "voltage", "online", "usb_type")
+    current: float
+    voltage: float
+    online: bool
+    usb_type: str | None
+    # ucsi power supplies query the EC on every read
+    sample_policy: ClassVar[dict[str, SamplePolicy]] = {
+        "usb_type": SamplePolicy(rate=SampleRate.IDENTITY, deadline=READ_DEADLINE_SECONDS),
+        "current_now": SamplePolicy(deadline=READ_DEADLINE_SECONDS),
+        "voltage_now": SamplePolicy(deadline=READ_DEADLINE_SECONDS),
+        "online": SamplePolicy(deadline=READ_DEADLINE_SECONDS),
+    }
+
+    def __init__(self, devpath: str):
+        super().__init__(devpath)
+        self.current = 0.0
+        self.voltage = 0.0
+        self.online = False
+        self.usb_type = None
+
+    def update(self) -> None:
+        self.begin_sample()
+        current = self.read_int_subfile("current_now", default=0) / 1000000
+        voltage = self.read_int_subfile("voltage_now", default=0) / 1000000
+        online = self.read_int_subfile("online") == 1
+        # The supply stays registered while nothing is plugged in, a change of
+        # the connection state is what tells us the partner (and usb_type) changed
+        if online != self.online or (voltage == 0) != (self.voltage == 0):
+            self.invalidate()
+
+        usb_type = self.read_str_subfile("usb_type")
+        if not usb_type:
+            current = 0.0
+            voltage = 0.0
+            online = False
+
+        if usb_type != self.usb_type or current != self.current or voltage != self.voltage or online != self.online:
+            self.usb_type = usb_type
+            self.current = current
+            self.voltage = voltage
+            self.online = online
+            self.generation += 1
 
 class ChargePort:
     devpath: str
+    info: ChargeInfo
 
     def __init__(self, devpath: str):
         super().__init__()
         self.devpath = devpath
+        self.info = ChargeInfo(devpath)
 
     def get_info(self) -> ChargeInfo | None:
-        info = ChargeInfo(self.devpath)
-        if not info.usb_type:
+        self.info.update()
+        if not self.info.usb_type:
             return None
-        return info
+        return self.info
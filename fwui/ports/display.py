@@ -1,24 +1,39 @@
-from .base import DevInfo
-from functools import cached_property
+from typing import ClassVar
+from .base import DevInfo, SamplePolicy
+from .reader import READ_DEADLINE_SECONDS
 
 class DisplayInfo(DevInfo):
-    @cached_property
+    __slots__ = ("status",)
+    status: str | None
+    # Reading the connector status may probe the link
+    sample_policy: ClassVar[dict[str, SamplePolicy]] = {"status": SamplePolicy(deadline=READ_DEADLINE_SECONDS)}
+
+    def __init__(self, devpath: str):
+        super().__init__(devpath)
+        self.status = None
+
+    @property
     def connected(self) -> bool:
         return self.status == "connected"
 
-    @cached_property
-    def status(self) -> str | None:
-        return self.read_str_subfile("status")
+    def update(self) -> None:
+        self.begin_sample()
+        status = self.read_str_subfile("status")
+        if status != self.status:
+            self.status = status
+            self.generation += 1
 
 class DisplayPort:
     display: str
+    info: DisplayInfo
 
     def __init__(self, display: str):
         super().__init__()
         self.display = display
+        self.info = DisplayInfo(display)
 
     def get_info(self) -> DisplayInfo | None:
-        info = DisplayInfo(self.display)
-        if not info.status:
+        self.info.update()
+        if not self.info.status:
             return None
-        return info
+        return self.info
@@ -0,0 +1,65 @@
+from collections import Counter
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+
+# Some attributes (ucsi power supplies, DRM connector status) make the kernel talk to the EC
+# or probe the link and can block for hundreds of milliseconds. Those reads go through a small
+# pool with a deadline, a missed deadline returns the last known value and the read is left
+# to finish in the background, it is picked up by the next sample. Without a last known value
+# there is nothing to fall back to, so the first read of an attribute always waits for the result.
+
+READER_WORKERS = 4
+READ_DEADLINE_SECONDS = 0.05
+
+class SysfsReader:
+    slow_reads: Counter[str] # per devpath
+    _pool: ThreadPoolExecutor
+    _lock: Lock
+    _pending: dict[str, Future[bytes | None]]
+    _last: dict[str, bytes | None]
+
+    def __init__(self, workers: int = READER_WORKERS):
+        super().__init__()
+        self.slow_reads = Counter()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sysfs-reader")
+        self._lock = Lock()
+        self._pending = {}
+        self._last = {}
+
+    def read(self, devpath: str, key: str, read: Callable[[], bytes | None], deadline: float) -> tuple[bytes | None, bool]:
+        # Returns the value and whether it is stale
+        with self._lock:
+            has_last = key in self._last
+            future = self._pending.get(key, None)
+            if future is None:
+                future = self._pool.submit(read)
+                self._pending[key] = future
+            elif not future.done() and has_last:
+                # Still stuck on the previous read, don't queue up another one behind it
+                return self._last[key], True
+
+        try:
+            value = future.result(timeout=deadline if has_last else None)
+        except TimeoutError:
+            with self._lock:
+                self.slow_reads[devpath] += 1
+                return self._last[key], True
+        except BaseException:
+            with self._lock:
+                _ = self._pending.pop(key, None)
+            raise
+
+        with self._lock:
+            _ = self._pending.pop(key, None)
+            self._last[key] = value
+        return value, False
+
+_reader: SysfsReader | None = None
+
+def set_sysfs_reader(reader: SysfsReader | None) -> None:
+    global _reader
+    _reader = reader
+
+def get_sysfs_reader() -> SysfsReader | None:
+    return _reader
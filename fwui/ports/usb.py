@@ -1,29 +1,57 @@
-from .base import DevInfo
-from functools import cached_property
+from os import stat
+from typing import ClassVar, override
+from .base import DevInfo, SamplePolicy, SampleRate
+
+IDENTITY_POLICY = SamplePolicy(rate=SampleRate.IDENTITY)
 
 class USBInfo(DevInfo):
-    @cached_property
-    def vid(self) -> int:
-        return self.read_int_subfile("idVendor", base=16, default=0)
+    __slots__ = ("vid", "pid", "speed")
+    vid: int
+    pid: int
+    speed: int
+    sample_policy: ClassVar[dict[str, SamplePolicy]] = {
+        "idVendor": IDENTITY_POLICY,
+        "idProduct": IDENTITY_POLICY,
+        "speed": IDENTITY_POLICY,
+    }
+
+    def __init__(self, devpath: str):
+        super().__init__(devpath)
+        self.vid = 0
+        self.pid = 0
+        self.speed = 0
 
-    @cached_property
-    def pid(self) -> int:
-        return self.read_int_subfile("idProduct", base=16, default=0)
+    @override
+    def hotplug_key(self) -> object:
+        # The device directory is recreated (with a new inode) whenever something is plugged in
+        try:
+            return stat(self.devpath).st_ino
+        except FileNotFoundError:
+            return None
 
-    @cached_property
-    def speed(self) -> int:
-        return self.read_int_subfile("speed", default=0)
+    def update(self) -> None:
+        self.begin_sample()
+        vid = self.read_int_subfile("idVendor", base=16, default=0)
+        pid = self.read_int_subfile("idProduct", base=16, default=0)
+        speed = self.read_int_subfile("speed", default=0) if vid and pid else 0
+        if vid != self.vid or pid != self.pid or speed != self.speed:
+            self.vid = vid
+            self.pid = pid
+            self.speed = speed
+            self.generation += 1
 
 class USBPort:
     subdevs: list[str]
+    infos: list[USBInfo]
 
     def __init__(self, subdevs: list[str]):
         super().__init__()
         self.subdevs = subdevs
+        self.infos = [USBInfo(subdev) for subdev in subdevs]
 
     def get_info(self) -> USBInfo | None:
-        for subdev in self.subdevs:
-            info = USBInfo(subdev)
+        for info in self.infos:
+            info.update()
             if info.vid and info.pid:
                 return info
 
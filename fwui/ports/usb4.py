@@ -0,0 +1,162 @@
+from os import listdir, path
+from re import compile as re_compile
+from threading import Lock
+from typing import ClassVar
+from .base import DevInfo, SamplePolicy, SampleRate
+
+THUNDERBOLT_DEVICES_PATH = "/sys/bus/thunderbolt/devices"
+
+# Router names are "<domain>-<route>", the route holds one hop (adapter number) per byte, first hop lowest
+ROUTER_NAME_RE = re_compile(r"^(\d+)-([0-9a-f]+)$")
+# usb4_port directories are "usb4_port<adapter>"
+USB4_PORT_RE = re_compile(r"^usb4_port(\d+)$")
+
+class ThunderboltRouter(DevInfo):
+    __slots__ = ("name", "domain", "route")
+    name: str
+    domain: int
+    route: int
+    # Authorization is done once by the user or boltd after the router shows up
+    sample_policy: ClassVar[dict[str, SamplePolicy]] = {"authorized": SamplePolicy(rate=SampleRate.SLOW)}
+
+    def __init__(self, devpath: str, name: str, domain: int, route: int):
+        super().__init__(devpath)
+        self.name = name
+        self.domain = domain
+        self.route = route
+
+    @property
+    def host_name(self) -> str:
+        return f"{self.domain}-0"
+
+    @property
+    def first_hop(self) -> int:
+        return self.route & 0xFF
+
+PortKey = tuple[str, int] # host router name, adapter
+
+class ThunderboltTopology:
+    # Index of the router tree, rebuilt incrementally when
+    # the device list changes instead of being rescanned every frame
+    devices_path: str
+    generation: int
+    _names: frozenset[str]
+    _routers: dict[str, ThunderboltRouter]
+    _port_routers: dict[PortKey, ThunderboltRouter]
+    _lock: Lock
+
+    def __init__(self, devices_path: str = THUNDERBOLT_DEVICES_PATH):
+        super().__init__()
+        self.devices_path = devices_path
+        self.generation = 0
+        self._names = frozenset()
+        self._routers = {}
+        self._port_routers = {}
+        self._lock = Lock()
+
+    def _add(self, name: str) -> None:
+        match = ROUTER_NAME_RE.match(name)
+        if match:
+            route = int(match.group(2), 16)
+            if route == 0:
+                return
+            router = ThunderboltRouter(path.join(self.devices_path, name), name, int(match.group(1)), route)
+            self._routers[name] = router
+            # Only routers directly attached to the host are mapped to physical ports
+            if route <= 0xFF:
+                self._port_routers[(router.host_name, router.first_hop)] = router
+
+    def _remove(self, name: str) -> None:
+        router = self._routers.pop(name, None)
+        if router:
+            key = (router.host_name, router.first_hop)
+            if self._port_routers.get(key, None) is router:
+                del self._port_routers[key]
+
+    def refresh(self) -> None:
+        # A single readdir per call, only added or removed entries are parsed
+        try:
+            names = frozenset(listdir(self.devices_path))
+        except FileNotFoundError:
+            names = frozenset[str]()
+
+        with self._lock:
+            if names == self._names:
+                return
+            for name in self._names - names:
+                self._remove(name)
+            for name in sorted(names - self._names):
+                self._add(name)
+            self._names = names
+            self.generation += 1
+
+    def port_router(self, host_name: str, adapter: int) -> ThunderboltRouter | None:
+        return self._port_routers.get((host_name, adapter), None)
+
+class USB4Info(DevInfo):
+    __slots__ = ("host_name", "adapter", "link", "router", "authorized", "_topology_generation")
+    host_name: str
+    adapter: int
+    link: str | None
+    router: ThunderboltRouter | None
+    authorized: bool
+    _topology_generation: int
+
+    def __init__(self, devpath: str):
+        super().__init__(devpath)
+        match = USB4_PORT_RE.match(path.basename(path.normpath(devpath)))
+        if not match:
+            raise ValueError(f"Not a usb4_port path: {devpath}")
+        self.host_name = path.basename(path.dirname(path.normpath(devpath)))
+        self.adapter = int(match.group(1))
+        self.link = None
+        self.router = None
+        self.authorized = False
+        self._topology_generation = -1
+
+    @property
+    def active(self) -> bool:
+        return bool(self.link) and self.link != "none"
+
+    @property
+    def pcie_tunnel(self) -> bool:
+        # PCIe tunnels are only set up for authorized routers
+        return self.router is not None and self.authorized
+
+    def update(self, topology: ThunderboltTopology) -> None:
+        self.begin_sample()
+        changed = False
+        if topology.generation != self._topology_generation:
+            self._topology_generation = topology.generation
+            router = topology.port_router(self.host_name, self.adapter)
+            if router is not self.router:
+                self.router = router
+                changed = True
+
+        link = self.read_str_subfile("link")
+        authorized = self.router.read_int_subfile("authorized") == 1 if self.router else False
+        if link != self.link or authorized != self.authorized:
+            self.link = link
+            self.authorized = authorized
+            changed = True
+
+        if changed:
+            self.generation += 1
+
+class USB4Port:
+    devpath: str
+    topology: ThunderboltTopology
+    info: USB4Info
+
+    def __init__(self, devpath: str, topology: ThunderboltTopology):
+        super().__init__()
+        self.devpath = devpath
+        self.topology = topology
+        self.info = USB4Info(devpath)
+
+    def get_info(self) -> USB4Info | None:
+        # The topology is refreshed once per sample by its owner
+        self.info.update(self.topology)
+        if not self.info.active and not self.info.router:
+            return None
+        return self.info
@@ -0,0 +1,123 @@
+from collections import Counter, deque
+from datetime import datetime
+from os import path
+from sys import _current_frames as current_frames # pyright: ignore[reportPrivateUsage]
+from threading import Lock, Thread, enumerate as enumerate_threads, get_ident
+from time import monotonic, sleep
+from types import FrameType
+
+# Profiles are written as collapsed stacks ("thread;outer;inner count" per line),
+# which flamegraph.pl, inferno and speedscope read directly
+
+PROFILE_SECONDS = 10.0
+PROFILE_INTERVAL_SECONDS = 0.005
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def collapse_stack(thread_name: str, frame: FrameType | None) -> str:
+    labels: list[str] = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+def _output_path(output_dir: str, kind: str, extension: str) -> str:
+    return path.join(output_dir, f"fwui-{kind}-{datetime.now():%Y%m%d-%H%M%S}.{extension}")
+
+class SamplingProfiler:
+    # Nothing runs until start() is called, the sampling thread only lives for the duration of a profile
+    duration: float
+    interval: float
+    output_dir: str
+    _lock: Lock
+    _thread: Thread | None
+
+    def __init__(self, duration: float = PROFILE_SECONDS, interval: float = PROFILE_INTERVAL_SECONDS, output_dir: str = "."):
+        super().__init__()
+        self.duration = duration
+        self.interval = interval
+        self.output_dir = output_dir
+        self._lock = Lock()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        with self._lock:
+            if self.running:
+                return False
+            self._thread = Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+        return True
+
+    def _sample(self, own_id: int, counts: Counter[str]) -> None:
+        names = {thread.ident: thread.name for thread in enumerate_threads()}
+        for thread_id, frame in current_frames().items():
+            if thread_id == own_id:
+                continue
+            counts[collapse_stack(names.get(thread_id, str(thread_id)), frame)] += 1
+
+    def _run(self) -> None:
+        own_id = get_ident()
+        counts: Counter[str] = Counter()
+        end = monotonic() + self.duration
+        while monotonic() < end:
+            self._sample(own_id, counts)
+            sleep(self.interval)
+
+        output_path = _output_path(self.output_dir, "profile", "folded")
+        with open(output_path, "w") as f:
+            for stack, count in sorted(counts.items()):
+                _ = f.write(f"{stack} {count}\n")
+        print(f"Profile written to {output_path} ({sum(counts.values())} samples)")
+
+class FrameTrace:
+    # Timestamps (monotonic) of the stages a frame went through, scope is "frame", "port:<id>" or "matrix:<id>"
+    __slots__ = ("frame", "start", "stages")
+    frame: int
+    start: float
+    stages: list[tuple[str, str, float]]
+
+    def __init__(self, frame: int):
+        super().__init__()
+        self.frame = frame
+        self.start = monotonic()
+        self.stages = []
+
+    def mark(self, scope: str, stage: str) -> None:
+        self.stages.append((scope, stage, monotonic()))
+
+    def format(self) -> str:
+        stages = list(self.stages)
+        total = max((s[2] for s in stages), default=self.start) - self.start
+        lines = [f"frame {self.frame} total={total * 1000:.2f}ms"]
+        for scope, stage, timestamp in sorted(stages, key=lambda s: s[2]):
+            lines.append(f"  +{(timestamp - self.start) * 1000:8.2f}ms {scope:<12} {stage}")
+        return "\n".join(lines)
+
+class FrameTracer:
+    _traces: deque[FrameTrace]
+    _next_frame: int
+
+    def __init__(self, capacity: int):
+        super().__init__()
+        self._traces = deque(maxlen=capacity)
+        self._next_frame = 0
+
+    def begin(self) -> FrameTrace:
+        trace = FrameTrace(self._next_frame)
+        self._next_frame += 1
+        self._traces.append(trace)
+        return trace
+
+    def dump(self, output_dir: str = ".") -> str:
+        output_path = _output_path(output_dir, "traces", "txt")
+        with open(output_path, "w") as f:
+            for trace in list(self._traces):
+                _ = f.write(trace.format() + "\n\n")
+        return output_path
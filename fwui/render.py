@@ -2,6 +2,9 @@ from dataclasses import dataclass, field
 from .ports.usb import USBInfo
 from .ports.charge import ChargeInfo
 from .ports.display import DisplayInfo
+from .ports.usb4 import USB4Info
+from .telemetry import PortTelemetry
+from .icons import Icon
 from .ledmatrix import LEDMatrix, LED_MATRIX_COLS, LED_MATRIX_ROWS
 
 BLANK_PIXEL = 0x00
@@ -10,10 +13,7 @@ SEPARATOR_PIXEL = 0x22
 BLANK_ROW = [BLANK_PIXEL] * LED_MATRIX_COLS
 FULL_ROW = [0xFF] * LED_MATRIX_COLS
 
-BLANK_MATRIX = BLANK_ROW * LED_MATRIX_ROWS
-
-PER_POS_OFFSET = (LED_MATRIX_ROWS - 1) // 3
-ICON_ROWS = PER_POS_OFFSET - 3 # Top line, top space, bottom space
+BLANK_MATRIX = bytes(BLANK_ROW * LED_MATRIX_ROWS)
 
 def make_row_bar(width: float, height: int = 1, reverse: bool = False) -> list[int]:
     if width >= LED_MATRIX_COLS:
@@ -148,14 +148,68 @@ def make_multirow_bar(width: float, height: int = 1, reverse: bool = False) -> l
         width -= LED_MATRIX_COLS
     return res
 
-@dataclass(kw_only=True, frozen=True, eq=True)
 class RenderInfo:
+    # Stable per-port view handed to the renderers, updated in place every sample.
+    # generation changes whenever any of the port records changed or (dis)appeared.
+    __slots__ = ("usb", "display", "charge", "usb4", "telemetry", "matrix", "generation", "_usb_generation", "_display_generation", "_charge_generation", "_usb4_generation")
     usb: USBInfo | None
     display: DisplayInfo | None
     charge: ChargeInfo | None
+    usb4: USB4Info | None
+    telemetry: PortTelemetry | None
     matrix: LEDMatrix
-
-@dataclass(kw_only=True, frozen=True)
+    generation: int
+    _usb_generation: int
+    _display_generation: int
+    _charge_generation: int
+    _usb4_generation: int
+
+    def __init__(self, matrix: LEDMatrix, telemetry: PortTelemetry | None = None):
+        super().__init__()
+        self.usb = None
+        self.display = None
+        self.charge = None
+        self.usb4 = None
+        self.telemetry = telemetry
+        self.matrix = matrix
+        self.generation = 0
+        self._usb_generation = -1
+        self._display_generation = -1
+        self._charge_generation = -1
+        self._usb4_generation = -1
+
+    @property
+    def stale(self) -> bool:
+        # Some values missed their read deadline and are from an earlier sample
+        return any(info.stale for info in (self.usb, self.display, self.charge, self.usb4) if info)
+
+    def update(self, usb: USBInfo | None, display: DisplayInfo | None, charge: ChargeInfo | None, usb4: USB4Info | None) -> None:
+        usb_generation = usb.generation if usb else -1
+        display_generation = display.generation if display else -1
+        charge_generation = charge.generation if charge else -1
+        usb4_generation = usb4.generation if usb4 else -1
+        if usb is self.usb and display is self.display and charge is self.charge and usb4 is self.usb4 \
+                and usb_generation == self._usb_generation \
+                and display_generation == self._display_generation \
+                and charge_generation == self._charge_generation \
+                and usb4_generation == self._usb4_generation:
+            return
+
+        self.usb = usb
+        self.display = display
+        self.charge = charge
+        self.usb4 = usb4
+        self._usb_generation = usb_generation
+        self._display_generation = display_generation
+        self._charge_generation = charge_generation
+        self._usb4_generation = usb4_generation
+        self.generation += 1
+
+@dataclass(kw_only=True, frozen=True, slots=True)
 class RenderResult:
-    data: list[int] | None
+    data: Icon | None
+    # Fill level (0.0 - 1.0) shown by bar slots
+    level: float | None = field(default=None)
     allow_sleep: bool = field(default=True)
+
+EMPTY_RESULT = RenderResult(data=None)
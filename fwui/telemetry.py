@@ -0,0 +1,161 @@
+from array import array
+from mmap import mmap
+from os import path
+from struct import Struct
+from typing import Protocol
+
+# Persisted telemetry file layout (all integers little endian):
+#   FILE_HEADER
+#   per port: PORT_HEADER, then voltage, current and power rings (capacity floats each)
+
+TELEMETRY_MAGIC = b"FWTM"
+TELEMETRY_VERSION = 1
+PORT_ID_MAX_LEN = 16
+
+FILE_HEADER = Struct("<4sHHI") # magic, version, port count, capacity
+PORT_HEADER = Struct(f"<{PORT_ID_MAX_LEN}sII") # port id, head, count
+PORT_STATE = Struct("<II") # head, count (at the end of PORT_HEADER)
+FLOAT_SIZE = array("f").itemsize
+
+class FloatBuffer(Protocol):
+    # array("f") or a memoryview cast to "f" (when persisted to a file)
+    def __len__(self) -> int: ...
+    def __getitem__(self, index: int, /) -> float: ...
+    def __setitem__(self, index: int, value: float, /) -> None: ...
+
+class RingBuffer:
+    capacity: int
+    _values: FloatBuffer
+    head: int
+    count: int
+
+    def __init__(self, values: FloatBuffer, head: int = 0, count: int = 0):
+        super().__init__()
+        self._values = values
+        self.capacity = len(values)
+        self.head = head % self.capacity
+        self.count = min(count, self.capacity)
+
+    def append(self, value: float) -> None:
+        self._values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def _window_indices(self, window: int | None) -> range:
+        count = self.count if window is None else min(window, self.count)
+        return range(self.head - count, self.head)
+
+    def values(self, window: int | None = None) -> list[float]:
+        # Oldest first
+        return [self._values[i % self.capacity] for i in self._window_indices(window)]
+
+    def min(self, window: int | None = None) -> float | None:
+        indices = self._window_indices(window)
+        if not indices:
+            return None
+        return min(self._values[i % self.capacity] for i in indices)
+
+    def max(self, window: int | None = None) -> float | None:
+        indices = self._window_indices(window)
+        if not indices:
+            return None
+        return max(self._values[i % self.capacity] for i in indices)
+
+    def mean(self, window: int | None = None) -> float | None:
+        indices = self._window_indices(window)
+        if not indices:
+            return None
+        return sum(self._values[i % self.capacity] for i in indices) / len(indices)
+
+class PortTelemetry:
+    voltage: RingBuffer
+    current: RingBuffer
+    power: RingBuffer
+    _state: memoryview | None
+
+    def __init__(self, voltage: RingBuffer, current: RingBuffer, power: RingBuffer, state: memoryview | None = None):
+        super().__init__()
+        self.voltage = voltage
+        self.current = current
+        self.power = power
+        self._state = state
+
+    def record(self, voltage: float, current: float) -> None:
+        self.voltage.append(voltage)
+        self.current.append(current)
+        self.power.append(voltage * current)
+        if self._state is not None:
+            PORT_STATE.pack_into(self._state, 0, self.power.head, self.power.count)
+
+class TelemetryStore:
+    capacity: int
+    _ports: dict[str, PortTelemetry]
+    _map: mmap | None
+
+    def __init__(self, capacity: int, port_ids: list[str], file_path: str | None = None):
+        super().__init__()
+        self.capacity = capacity
+        self._ports = {}
+        self._map = None
+
+        if not file_path:
+            for port_id in port_ids:
+                self._ports[port_id] = PortTelemetry(
+                    voltage=RingBuffer(array("f", bytes(capacity * FLOAT_SIZE))),
+                    current=RingBuffer(array("f", bytes(capacity * FLOAT_SIZE))),
+                    power=RingBuffer(array("f", bytes(capacity * FLOAT_SIZE))),
+                )
+            return
+
+        ring_size = capacity * FLOAT_SIZE
+        port_size = PORT_HEADER.size + (3 * ring_size)
+        file_size = FILE_HEADER.size + (len(port_ids) * port_size)
+        raw_port_ids = [port_id.encode("utf-8")[:PORT_ID_MAX_LEN].ljust(PORT_ID_MAX_LEN, b"\x00") for port_id in port_ids]
+
+        self._map = self._open_map(file_path, file_size, len(port_ids))
+        view = memoryview(self._map)
+
+        for i, port_id in enumerate(port_ids):
+            offset = FILE_HEADER.size + (i * port_size)
+            raw_port_id, head, count = PORT_HEADER.unpack_from(view, offset)
+            if raw_port_id != raw_port_ids[i]:
+                # Port list changed, history of this slot belongs to another port
+                head = 0
+                count = 0
+                PORT_HEADER.pack_into(view, offset, raw_port_ids[i], head, count)
+
+            rings: list[RingBuffer] = []
+            for ring in range(3):
+                ring_offset = offset + PORT_HEADER.size + (ring * ring_size)
+                rings.append(RingBuffer(view[ring_offset:ring_offset + ring_size].cast("f"), head, count))
+
+            self._ports[port_id] = PortTelemetry(
+                voltage=rings[0],
+                current=rings[1],
+                power=rings[2],
+                state=view[offset + PORT_ID_MAX_LEN:offset + PORT_HEADER.size],
+            )
+
+    def _open_map(self, file_path: str, file_size: int, port_count: int) -> mmap:
+        expected_header = FILE_HEADER.pack(TELEMETRY_MAGIC, TELEMETRY_VERSION, port_count, self.capacity)
+
+        valid = False
+        if path.exists(file_path) and path.getsize(file_path) == file_size:
+            with open(file_path, "rb") as f:
+                valid = f.read(FILE_HEADER.size) == expected_header
+
+        if not valid:
+            with open(file_path, "wb") as f:
+                _ = f.write(expected_header)
+                _ = f.truncate(file_size)
+
+        with open(file_path, "r+b") as f:
+            return mmap(f.fileno(), file_size)
+
+    def get(self, port_id: str) -> PortTelemetry | None:
+        return self._ports.get(port_id, None)
+
+    def flush(self) -> None:
+        if self._map:
+            self._map.flush()
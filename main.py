@@ -1,47 +1,79 @@
 #!/usr/bin/env python3
 
 from yaml import safe_load as yaml_load
-from fwui.ledmatrix import LEDMatrix, LED_MATRIX_COLS
+from fwui.ledmatrix import LEDMatrix
+from fwui.fakepanel import FakePanel
 from fwui.ports.charge import ChargePort
 from fwui.ports.display import DisplayPort
 from fwui.ports.usb import USBPort
-from time import sleep
-from fwui.icons import EMPTY_ICON
-from fwui.devices import DEVICE_MATCHERS
-from fwui.render import RenderInfo, RenderResult, PER_POS_OFFSET, ICON_ROWS, SEPARATOR_PIXEL, BLANK_PIXEL, BLANK_MATRIX
+from fwui.ports.usb4 import USB4Port, ThunderboltTopology
+from fwui.ports.reader import READER_WORKERS, SysfsReader, set_sysfs_reader
+from fwui.icons import load_icon_pack
+from fwui.devices import DEVICE_MATCHERS, set_charge_style
+from fwui.telemetry import PortTelemetry, TelemetryStore
+from fwui.render import RenderInfo, RenderResult, BLANK_MATRIX, EMPTY_RESULT
+from fwui.layout import CompiledSlot, DEFAULT_LAYOUT, compile_layout, parse_slot_config
+from fwui.control import ControlServer, OverlayStore
+from fwui.pipeline import Pipeline
+from fwui.profiling import FrameTrace, FrameTracer, SamplingProfiler, PROFILE_INTERVAL_SECONDS, PROFILE_SECONDS
+from dataclasses import dataclass
+from signal import SIGUSR1, SIGUSR2, signal
 from threading import Thread
+from types import FrameType
 from datetime import datetime, timedelta
+from time import monotonic
+from typing import Any, cast
 
 TIME_ZERO = datetime.fromtimestamp(0)
 sleep_idle_seconds = timedelta(seconds=60)
 sleep_individual_ports = False
 frame_time_seconds = 1.0
+# threaded: every panel is drawn by its own thread, coordinated: all frames are written first, then all acks collected
+present_mode = "threaded"
 
 class PortConfig:
+    id: str
     usb_port: USBPort | None
+    usb4_port: USB4Port | None
     display_port: DisplayPort | None
     charge_port: ChargePort | None
+    telemetry: PortTelemetry | None
     matrix: LEDMatrix
-    row: int
+    slots: list[CompiledSlot]
+    info: RenderInfo
 
     last_sleep_block: datetime
     _last_render: RenderResult | None = None
+    _last_generation: int = -1
+    _last_volatile: bool = False
 
-    def __init__(self, usb_port: USBPort | None, display_port: DisplayPort | None, charge_port: ChargePort | None, matrix: LEDMatrix, row: int):
+    def __init__(self, id: str, usb_port: USBPort | None, usb4_port: USB4Port | None, display_port: DisplayPort | None, charge_port: ChargePort | None, telemetry: PortTelemetry | None, matrix: LEDMatrix, slots: list[CompiledSlot]):
         super().__init__()
+        self.id = id
         self.charge_port = charge_port
+        self.telemetry = telemetry
         self.display_port = display_port
         self.usb_port = usb_port
-        self.row = row
+        self.usb4_port = usb4_port
+        self.slots = slots
         self.matrix = matrix
+        self.info = RenderInfo(matrix=matrix, telemetry=telemetry)
         self.last_sleep_block = datetime.now()
 
-    def render(self) -> list[int] | None:
-        res = self._render()
-        if not res:
-            res = RenderResult(data=None)
+    def render(self) -> RenderResult:
+        if not self.usb_port:
+            res = EMPTY_RESULT
+        else:
+            self._sample()
+            # Renderers that only depend on the port records can't produce anything new
+            # unless the generation moved, so skip matching and rendering altogether
+            if self._last_render and not self._last_volatile and self.info.generation == self._last_generation:
+                res = self._last_render
+            else:
+                res = self._render()
+            self._last_generation = self.info.generation
 
-        if res == self._last_render:
+        if res is self._last_render or res == self._last_render:
             allow_sleep = res.allow_sleep
         else:
             allow_sleep = False
@@ -50,41 +82,72 @@ class PortConfig:
         if not allow_sleep:
             self.last_sleep_block = datetime.now()
 
-        return res.data
+        return res
 
-    def _render(self) -> RenderResult | None:
-        if not self.usb_port:
-            return None
+    def _sample(self) -> None:
+        charge = self.charge_port.get_info() if self.charge_port else None
+        if self.telemetry:
+            if charge:
+                self.telemetry.record(charge.voltage, charge.current)
+            else:
+                self.telemetry.record(0.0, 0.0)
 
-        render_info = RenderInfo(
+        self.info.update(
             usb=self.usb_port.get_info() if self.usb_port else None,
             display=self.display_port.get_info() if self.display_port else None,
-            charge=self.charge_port.get_info() if self.charge_port else None,
-            matrix=self.matrix,
+            charge=charge,
+            usb4=self.usb4_port.get_info() if self.usb4_port else None,
         )
 
+    def _render(self) -> RenderResult:
         for matcher, usbdev in DEVICE_MATCHERS:
-            if not matcher.matches(render_info):
+            if not matcher.matches(self.info):
                 continue
-            res = usbdev.render(render_info)
+            res = usbdev.render(self.info)
             if res:
+                self._last_volatile = usbdev.volatile
                 return res
 
-        return None
+        self._last_volatile = False
+        return EMPTY_RESULT
 
-ICON_PREFIX = ([SEPARATOR_PIXEL] * LED_MATRIX_COLS) + ([BLANK_PIXEL] * LED_MATRIX_COLS)
-ICON_SUFFIX = ([BLANK_PIXEL] * LED_MATRIX_COLS) + ([SEPARATOR_PIXEL] * LED_MATRIX_COLS)
-ICON_ADD_ROWS = 4
+@dataclass(kw_only=True, frozen=True, slots=True)
+class FrameSet:
+    frames: dict[LEDMatrix, bytes | None]
+    trace: FrameTrace | None
+    # Ports showing values that missed their read deadline
+    stale_ports: int
 
 class PortUI:
     ports: list[PortConfig]
-
-    def __init__(self, ports: list[PortConfig]):
+    overlays: OverlayStore
+    control: ControlServer | None
+    tracer: FrameTracer | None
+    topology: ThunderboltTopology | None
+    # Time between the first and the last panel acknowledging the last presented frame
+    # (cleared panels send no ack and are left out)
+    skew: float
+    back_buffers: dict[LEDMatrix, bytearray]
+    front_buffers: dict[LEDMatrix, bytes | None]
+
+    def __init__(self, ports: list[PortConfig], overlays: OverlayStore, control: ControlServer | None, tracer: FrameTracer | None = None, topology: ThunderboltTopology | None = None):
         super().__init__()
         self.ports = ports
-
-    def _render_port(self, port: PortConfig, image_data: list[int], last_sleep_blocks: dict[LEDMatrix, datetime]) -> None:
-        data = port.render()
+        self.overlays = overlays
+        self.control = control
+        self.tracer = tracer
+        self.topology = topology
+        self.skew = 0.0
+        self.back_buffers = {}
+        self.front_buffers = {}
+
+    def _render_port(self, port: PortConfig, image_data: bytearray, last_sleep_blocks: dict[LEDMatrix, datetime], trace: FrameTrace | None) -> None:
+        scope = f"port:{port.id}"
+        if trace:
+            trace.mark(scope, "start")
+        res = port.render()
+        if trace:
+            trace.mark(scope, "rendered")
 
         if sleep_idle_seconds is None:
             pass
@@ -94,55 +157,133 @@ class PortUI:
         elif last_sleep_blocks.get(port.matrix, TIME_ZERO) < port.last_sleep_block:
             last_sleep_blocks[port.matrix] = port.last_sleep_block
 
-        if not data:
-            data = EMPTY_ICON
+        for slot in port.slots:
+            slot.draw(image_data, res)
+        if trace:
+            trace.mark(scope, "composed")
+
+    def _draw_matrix(self, matrix: LEDMatrix, frame: bytes | None, trace: FrameTrace | None, shown: dict[LEDMatrix, float]) -> None:
+        scope = f"matrix:{matrix.id}"
+        if trace:
+            trace.mark(scope, "start")
+        if not frame or not any(frame):
+            matrix.clear()
+        else:
+            matrix.draw(frame)
+            shown[matrix] = monotonic()
+        if trace:
+            trace.mark(scope, "drawn")
+
+    def _wait_ack(self, matrix: LEDMatrix, trace: FrameTrace | None, shown: dict[LEDMatrix, float]) -> None:
+        matrix.wait_ack()
+        shown[matrix] = monotonic()
+        if trace:
+            trace.mark(f"matrix:{matrix.id}", "drawn")
+
+    def _present_threaded(self, frames: dict[LEDMatrix, bytes | None], trace: FrameTrace | None, shown: dict[LEDMatrix, float]) -> None:
+        all_threads: list[Thread] = []
+
+        for matrix, frame in frames.items():
+            t = Thread(target=self._draw_matrix, args=(matrix, frame, trace, shown), name=f"draw-matrix-{matrix.id}")
+            all_threads.append(t)
+            t.start()
 
-        if len(data) != LED_MATRIX_COLS * ICON_ROWS:
-            raise ValueError(f"Invalid icon size expected={LED_MATRIX_COLS * ICON_ROWS} actual={len(data)} data={data}")
+        for t in all_threads:
+            t.join()
 
-        start = (port.row * LED_MATRIX_COLS)
-        image_data[start:start+(LED_MATRIX_COLS * (ICON_ROWS+ICON_ADD_ROWS))] = ICON_PREFIX + data + ICON_SUFFIX
+    def _present_coordinated(self, frames: dict[LEDMatrix, bytes | None], trace: FrameTrace | None, shown: dict[LEDMatrix, float]) -> None:
+        # All frames go out back to back before waiting for any ack, so the panels
+        # switch within a single round trip of each other
+        acked: list[LEDMatrix] = []
+        for matrix, frame in frames.items():
+            if trace:
+                trace.mark(f"matrix:{matrix.id}", "start")
+            if not frame or not any(frame):
+                matrix.clear()
+            else:
+                matrix.write_frame(frame)
+                acked.append(matrix)
 
-    def _draw_matrix(self, matrix: LEDMatrix, image_data: list[int]) -> None:
-        if not image_data or image_data == BLANK_MATRIX:
-            matrix.clear()
-            return
+        # Every ack is waited for on its own thread, so each one is timestamped when it arrives
+        # instead of after the acks of the panels before it
+        all_threads: list[Thread] = []
+        for matrix in acked:
+            t = Thread(target=self._wait_ack, args=(matrix, trace, shown), name=f"ack-matrix-{matrix.id}")
+            all_threads.append(t)
+            t.start()
 
-        matrix.draw(bytes(image_data))
+        for t in all_threads:
+            t.join()
 
-    def render(self) -> None:
-        all_images: dict[LEDMatrix, list[int] | None] = {}
+    def sample(self) -> FrameSet:
         all_threads: list[Thread] = []
         last_sleep_blocks: dict[LEDMatrix, datetime] = {}
+        trace = self.tracer.begin() if self.tracer else None
+
+        # Shared by all USB4 ports, which only read the index
+        if self.topology:
+            self.topology.refresh()
+
+        # Back buffers are only ever touched by the sampler, the presenter gets immutable snapshots
+        for back_buffer in self.back_buffers.values():
+            back_buffer[:] = BLANK_MATRIX
 
         for port in self.ports:
-            image_data = all_images.get(port.matrix, None)
-            if not image_data:
-                image_data = BLANK_MATRIX.copy()
-                all_images[port.matrix] = image_data
+            back_buffer = self.back_buffers.get(port.matrix, None)
+            if back_buffer is None:
+                back_buffer = bytearray(BLANK_MATRIX)
+                self.back_buffers[port.matrix] = back_buffer
 
-            t = Thread(target=self._render_port, args=(port, image_data, last_sleep_blocks))
+            t = Thread(target=self._render_port, args=(port, back_buffer, last_sleep_blocks, trace), name=f"render-port-{port.id}")
             all_threads.append(t)
             t.start()
 
         for t in all_threads:
             t.join()
-        all_threads.clear()
 
-        for matrix, image_data in all_images.items():
+        frames: dict[LEDMatrix, bytes | None] = {}
+        for matrix, back_buffer in self.back_buffers.items():
+            image_data: bytearray | None = back_buffer
             if not sleep_individual_ports:
                 last_sleep_block = last_sleep_blocks.get(matrix, TIME_ZERO)
                 if sleep_idle_seconds is None:
                     pass
                 elif last_sleep_block and (last_sleep_block + sleep_idle_seconds < datetime.now()):
                     image_data = None
-            t = Thread(target=self._draw_matrix, args=(matrix, image_data))
-            all_threads.append(t)
-            t.start()
 
-        for t in all_threads:
-            t.join()
-        all_threads.clear()
+            if self.overlays.has_overlays(matrix.id):
+                if image_data is None:
+                    image_data = back_buffer
+                    image_data[:] = BLANK_MATRIX
+                self.overlays.apply(matrix.id, image_data)
+
+            frames[matrix] = bytes(image_data) if image_data is not None else None
+
+        if trace:
+            trace.mark("frame", "sampled")
+        stale_ports = sum(1 for port in self.ports if port.info.stale)
+        return FrameSet(frames=frames, trace=trace, stale_ports=stale_ports)
+
+    def present(self, frame_set: FrameSet) -> None:
+        frames = frame_set.frames
+        trace = frame_set.trace
+        if trace:
+            trace.mark("frame", "present")
+
+        shown: dict[LEDMatrix, float] = {}
+        if present_mode == "coordinated":
+            self._present_coordinated(frames, trace, shown)
+        else:
+            self._present_threaded(frames, trace, shown)
+        self.skew = (max(shown.values()) - min(shown.values())) if shown else 0.0
+
+        if trace:
+            trace.mark("frame", "presented")
+
+        for matrix, frame in frames.items():
+            if self.control and frame != self.front_buffers.get(matrix, None):
+                self.control.publish_frame(matrix.id, frame or BLANK_MATRIX)
+            self.front_buffers[matrix] = frame
 
 
 LED_MATRICES: dict[str, LEDMatrix] = {}
@@ -164,7 +305,7 @@ def clear_matrices() -> None:
         t.join()
 
 def main():
-    global sleep_idle_seconds, sleep_individual_ports, frame_time_seconds
+    global sleep_idle_seconds, sleep_individual_ports, frame_time_seconds, present_mode
     with open("config.yml", "r") as f:
         config = yaml_load(f)
 
@@ -180,17 +321,59 @@ def main():
         if config_sleep_individual_ports is not None:
             sleep_individual_ports = bool(config_sleep_individual_ports)
 
+    sysfs_read_workers = READER_WORKERS
     render_config = config.get("render")
     if render_config:
         config_frame_time_seconds = render_config.get("frame_time_seconds")
         if config_frame_time_seconds:
             frame_time_seconds = float(config_frame_time_seconds)
+        config_charge_style = render_config.get("charge_style")
+        if config_charge_style:
+            set_charge_style(str(config_charge_style))
+        sysfs_read_workers = int(render_config.get("sysfs_read_workers", sysfs_read_workers))
+        config_present_mode = render_config.get("present_mode")
+        if config_present_mode:
+            present_mode = str(config_present_mode)
+            if present_mode not in ("threaded", "coordinated"):
+                raise ValueError(f"Unknown present_mode {present_mode}")
+
+    sysfs_reader = SysfsReader(sysfs_read_workers) if sysfs_read_workers > 0 else None
+    set_sysfs_reader(sysfs_reader)
+
+    telemetry_samples = 120
+    telemetry_file = None
+    telemetry_config = config.get("telemetry")
+    if telemetry_config:
+        telemetry_samples = int(telemetry_config.get("samples", telemetry_samples))
+        telemetry_file = telemetry_config.get("file")
+    telemetry = TelemetryStore(
+        capacity=telemetry_samples,
+        port_ids=[str(ele["id"]) for ele in config["ports"] if "pd" in ele],
+        file_path=str(telemetry_file) if telemetry_file else None,
+    )
+
+    icon_pack_path = "icons.pack"
+    icon_source_paths = ["icons.yml"]
+    icons_config = config.get("icons")
+    if icons_config:
+        icon_pack_path = str(icons_config.get("pack", icon_pack_path))
+        icon_source_paths = [str(source) for source in icons_config.get("sources", icon_source_paths)]
+
+    print("Loading icon pack...")
+    _ = load_icon_pack(icon_pack_path, icon_source_paths)
 
     print("Loading LED matrices...")
+    matrix_layouts: dict[str, list[CompiledSlot]] = {}
     for ele in config["led_matrices"]:
-        matrix = LEDMatrix(ele["id"], ele["serial"])
+        serial = str(ele["serial"])
+        matrix = LEDMatrix(ele["id"], FakePanel() if serial == "fake" else serial)
         LED_MATRICES[ele["id"]] = matrix
 
+        layout = DEFAULT_LAYOUT
+        if "layout" in ele:
+            layout = [parse_slot_config(slot) for slot in ele["layout"]]
+        matrix_layouts[ele["id"]] = compile_layout(layout)
+
     print("Clearing matrices...")
     for matrix in LED_MATRICES.values():
         clear_matrices()
@@ -198,6 +381,7 @@ def main():
     print("Loading charge ports...")
 
     ui_ports: list[PortConfig] = []
+    thunderbolt_topology = ThunderboltTopology()
 
     for ele in config["ports"]:
         charge_port = None
@@ -212,23 +396,88 @@ def main():
         if "usb" in ele:
             usb_port = USBPort(ele["usb"])
 
+        usb4_port = None
+        if "usb4" in ele:
+            usb4_port = USB4Port(ele["usb4"], thunderbolt_topology)
+
         if "led_matrix" in ele:
+            matrix_id = ele["led_matrix"]["id"]
+            positions = ele["led_matrix"]["pos"]
+            if not isinstance(positions, list):
+                positions = [positions]
+            positions = [int(pos) for pos in cast(list[Any], positions)]
             ui_ports.append(PortConfig(
+                id=str(ele["id"]),
                 charge_port=charge_port,
+                telemetry=telemetry.get(str(ele["id"])),
                 display_port=display_port,
-                matrix=LED_MATRICES[ele["led_matrix"]["id"]],
+                matrix=LED_MATRICES[matrix_id],
                 usb_port=usb_port,
-                row=(ele["led_matrix"]["pos"] * PER_POS_OFFSET),
+                usb4_port=usb4_port,
+                slots=[matrix_layouts[matrix_id][pos] for pos in positions],
             ))
 
-    ui = PortUI(ui_ports)
+    overlays = OverlayStore()
+    control = None
+    control_config = config.get("control")
+    if control_config and control_config.get("socket"):
+        print("Starting control socket...")
+        control = ControlServer(str(control_config["socket"]), overlays)
+        control.start()
+
+    profile_seconds = PROFILE_SECONDS
+    profile_interval = PROFILE_INTERVAL_SECONDS
+    profiling_output_dir = "."
+    trace_count = 0
+    profiling_config = config.get("profiling")
+    if profiling_config:
+        profile_seconds = float(profiling_config.get("profile_seconds", profile_seconds))
+        profile_interval = float(profiling_config.get("profile_interval", profile_interval))
+        profiling_output_dir = str(profiling_config.get("output_dir", profiling_output_dir))
+        trace_count = int(profiling_config.get("traces", trace_count))
+
+    profiler = SamplingProfiler(duration=profile_seconds, interval=profile_interval, output_dir=profiling_output_dir)
+    tracer = FrameTracer(trace_count) if trace_count > 0 else None
+
+    def start_profile(signum: int, frame: FrameType | None) -> None:
+        if profiler.start():
+            print(f"Profiling for {profile_seconds:.1f}s...")
+
+    def dump_traces(signum: int, frame: FrameType | None) -> None:
+        if not tracer:
+            print("Frame tracing disabled, set profiling.traces to enable it")
+            return
+        print(f"Frame traces written to {tracer.dump(profiling_output_dir)}")
+
+    _ = signal(SIGUSR1, start_profile)
+    _ = signal(SIGUSR2, dump_traces)
+
+    ui = PortUI(ui_ports, overlays, control, tracer, thunderbolt_topology)
+
+    def wait_frame() -> None:
+        # Overlay changes cut the frame time short so they show up immediately
+        _ = overlays.wakeup.wait(frame_time_seconds)
+        overlays.wakeup.clear()
+
+    reported_slow_reads = 0
+
+    def present(frame_set: FrameSet) -> None:
+        nonlocal reported_slow_reads
+        ui.present(frame_set)
+        wire_rate = sum(matrix.wire_stats.bytes_per_second() for matrix in LED_MATRICES.values())
+        print(f"Render OK ({wire_rate:.0f} B/s, skew {ui.skew * 1000:.1f} ms, {pipeline.dropped_frames} dropped, {frame_set.stale_ports} stale ports)")
+
+        if sysfs_reader and sysfs_reader.slow_reads.total() != reported_slow_reads:
+            reported_slow_reads = sysfs_reader.slow_reads.total()
+            print("Slow sysfs reads: " + ", ".join(f"{devpath}={count}" for devpath, count in list(sysfs_reader.slow_reads.items())))
 
     print("FWUI loaded!")
 
-    while True:
-        ui.render()
-        print("Render OK")
-        sleep(frame_time_seconds)
+    pipeline = Pipeline(sample=ui.sample, present=present, wait=wait_frame)
+    try:
+        pipeline.run()
+    finally:
+        telemetry.flush()
 
 if __name__ == "__main__":
     try: